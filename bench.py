@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク (timetable_app の重い処理を手元で計測する)
+
+使い方
+──────────────────────────────────────────
+python bench.py journey [-n 2000] [--seed 1]   乗換検索 (Connection Scan)
+python bench.py tokyu-html [保存した unten.html ...] [-n 200]
+                                               東急 HTML フォールバックの解析
+                                               (ファイル省略時は同じ構造の合成ページ)
+──────────────────────────────────────────
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+import timetable_app as ta
+
+
+def _report(name: str, samples_ms: list[float]) -> None:
+    samples_ms = sorted(samples_ms)
+    n = len(samples_ms)
+    p = lambda q: samples_ms[min(n - 1, int(q * n))]
+    total_s = sum(samples_ms) / 1000
+    print(f"{name}: n={n}  mean={statistics.mean(samples_ms):.3f}ms  "
+          f"p50={p(0.50):.3f}ms  p95={p(0.95):.3f}ms  p99={p(0.99):.3f}ms  "
+          f"max={samples_ms[-1]:.3f}ms  ({n / total_s:.0f} q/s)")
+
+
+# ──────────────────────────────────────────
+#  乗換検索
+# ──────────────────────────────────────────
+def bench_journey(n: int, seed: int) -> None:
+    version = ta.timetable_data_version()
+
+    # 1) 曜日区分ごとの接続配列の構築 (初回のみ、CSV/Excel 読込を含む)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):   # 読込時の [DEBUG] 出力を抑える
+        sizes = {day: len(ta.journey_connections(day, version)[1]) for day in ta.DAY_TYPES}
+    print(f"build: {(time.perf_counter() - t0) * 1000:.0f}ms  connections={sizes}")
+
+    # 2) 実際の利用に近いクエリ: 各ボードから、朝〜深夜の任意時刻に任意の駅へ
+    rng      = random.Random(seed)
+    stations = sorted(ta.journey_stations())
+    boards   = list(ta.BOARD_ROUTES.items())
+    queries  = [(rng.choice(boards)[1], rng.choice(stations), rng.randrange(5 * 60, 24 * 60),
+                 rng.choice(ta.DAY_TYPES)) for _ in range(n)]
+
+    samples, found = [], 0
+    for routes, dest, start, day in queries:
+        t = time.perf_counter()
+        plan = ta.plan_journey(routes, dest, start, day, ta._NEXT_DAY_TYPE[day], version)
+        samples.append((time.perf_counter() - t) * 1000)
+        found += plan is not None
+    _report("journey", samples)
+    print(f"found: {found}/{n}")
+
+
+# ──────────────────────────────────────────
+#  東急 HTML フォールバック
+# ──────────────────────────────────────────
+def _parse_tokyu_html_full(text: str) -> list[dict]:
+    """比較用: 以前の実装 (ページ全体を木にして アイコン一覧を線形に部分一致検索)"""
+    soup = BeautifulSoup(text, 'html.parser')
+    result = []
+    for item in soup.select('.unten_info-body-item'):
+        line   = item.select_one('.line-name')
+        status = item.select_one('.unten_info-status-text')
+        img    = item.select_one('img')
+        if not line or not status:
+            continue
+        logo_path = None
+        if img and img.has_attr('src'):
+            icon_key = Path(img['src']).name.replace('.png', '').split('_')[-1]
+            for val in ta.LINE_ICONS:
+                if icon_key.lower() in val.lower():
+                    logo_path = val
+                    break
+        result.append({'line': line.get_text(strip=True), 'status': status.get_text(strip=True),
+                       'logo': logo_path})
+    return result
+
+
+def _synthetic_tokyu_page() -> str:
+    """unten.html と同じ構造の合成ページ (<head> の CSS/JS、ナビ、運行情報 9 路線、フッタ)"""
+    lines = [("東横線", "TY"), ("目黒線", "MG"), ("田園都市線", "DT"), ("大井町線", "OM"),
+             ("池上線", "IK"), ("東急多摩川線", "TM"), ("世田谷線", "SG"),
+             ("こどもの国線", "KD"), ("東急新横浜線", "SH")]
+    head = ("<head><meta charset='utf-8'><title>運行情報</title>"
+            + "<style>" + ".c{color:#000}\n" * 3000 + "</style>"
+            + "<script>" + "var a=[1,2,3];\n" * 3000 + "</script></head>")
+    nav = "<nav>" + "".join(f"<ul><li><a href='/p{i}'>メニュー{i}</a></li></ul>" for i in range(400)) + "</nav>"
+    items = "".join(
+        f"<div class='unten_info-body-item'><div class='line'><img src='/unten2/img/icon_{code}.png'>"
+        f"<span class='line-name'>{name}</span></div>"
+        f"<p class='unten_info-status-text'>平常どおり運転しています。</p></div>"
+        for name, code in lines)
+    foot = "<footer>" + "".join(f"<p>リンク{i}</p>" for i in range(400)) + "</footer>"
+    return f"<!DOCTYPE html><html>{head}<body>{nav}<main><div class='unten_info-body'>{items}</div></main>{foot}</body></html>"
+
+
+def bench_tokyu_html(files: list[str], n: int) -> None:
+    pages = [(f, Path(f).read_text(encoding="utf-8", errors="replace")) for f in files] \
+        or [("(synthetic)", _synthetic_tokyu_page())]
+    for name, text in pages:
+        new, old = ta.parse_tokyu_html(text), _parse_tokyu_html_full(text)
+        if [(x["line"], x["status"]) for x in new] != [(x["line"], x["status"]) for x in old]:
+            print(f"WARNING {name}: 解析結果が以前の実装と一致しません")
+        print(f"{name}: {len(text) / 1024:.0f}KB, {len(new)} records")
+        for label, fn in (("full tree ", _parse_tokyu_html_full), ("restricted", ta.parse_tokyu_html)):
+            samples = []
+            for _ in range(n):
+                t = time.perf_counter()
+                fn(text)
+                samples.append((time.perf_counter() - t) * 1000)
+            _report(f"  {label}", samples)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="target", required=True)
+    p = sub.add_parser("journey", help="乗換検索")
+    p.add_argument("-n", type=int, default=2000, help="クエリ数")
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("tokyu-html", help="東急 HTML フォールバックの解析")
+    p.add_argument("files", nargs="*", help="保存した unten.html (省略時は合成ページ)")
+    p.add_argument("-n", type=int, default=200, help="繰り返し回数")
+    args = ap.parse_args()
+
+    if args.target == "journey":
+        bench_journey(args.n, args.seed)
+    elif args.target == "tokyu-html":
+        bench_tokyu_html(args.files, args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+路線アイコン (static/img/**/*.png) ➜ スプライト 1 枚 + CSS
+
+使い方
+──────────────────────────────────────────
+python build_sprite.py [--height 80]
+──────────────────────────────────────────
+▪ 出力: static/img/line_sprite.png と static/line_sprite.css (どちらもリポジトリに含める)
+▪ 各アイコンを同じ高さに縮小して横一列に並べる。幅は縦横比のまま
+▪ CSS のクラス名は static/img/ からの相対パスから作る
+   "tokyurailway/icon_TY.png" ➜ .ri-tokyurailway-icon_TY (app.js の imgTag と同じ規則)
+▪ 表示サイズは要素の高さで決まる (background-size:auto 100% と aspect-ratio)。
+   位置は % 指定なので、どの大きさで表示しても同じ CSS のまま使える
+▪ 既定の高さは :where() で詳細度 0 にしてあり、style.css の高さ指定 (画面幅別を含む) が常に勝つ
+▪ アイコンを追加・差し替えたら実行し直す (Pillow が必要。アプリ本体には不要)
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import io
+from pathlib import Path
+
+from PIL import Image
+
+BASE_DIR    = Path(__file__).resolve().parent
+IMG_DIR     = BASE_DIR / "static" / "img"
+SPRITE_PNG  = IMG_DIR / "line_sprite.png"
+SPRITE_CSS  = BASE_DIR / "static" / "line_sprite.css"
+GAP         = 2    # 縮小時のにじみが隣に写らないように空ける px
+
+
+def sprite_class(rel: str) -> str:
+    """tokyurailway/icon_TY.png ➜ ri-tokyurailway-icon_TY"""
+    return "ri-" + rel.rsplit(".", 1)[0].replace("/", "-")
+
+
+def icon_files() -> list[str]:
+    return sorted(p.relative_to(IMG_DIR).as_posix() for p in IMG_DIR.rglob("*.png") if p != SPRITE_PNG)
+
+
+def build(height: int) -> tuple[bytes, str]:
+    cells = []
+    for rel in icon_files():
+        with Image.open(IMG_DIR / rel) as im:
+            im = im.convert("RGBA")
+            width = max(1, round(im.width * height / im.height))
+            cells.append((rel, im.resize((width, height), Image.LANCZOS)))
+
+    total = sum(im.width for _, im in cells) + GAP * (len(cells) - 1)
+    sheet = Image.new("RGBA", (total, height), (0, 0, 0, 0))
+    rules, x = [], 0
+    for rel, im in cells:
+        sheet.paste(im, (x, 0))
+        # background-position の % は (画像幅 - 要素幅) に対する割合 ➜ 表示倍率に依らない
+        pos = 0 if total == im.width else x / (total - im.width) * 100
+        rules.append(f".{sprite_class(rel)}{{aspect-ratio:{im.width}/{height};"
+                     f"background-position:{pos:.4f}% 0}}")
+        x += im.width + GAP
+
+    buf = io.BytesIO()
+    # 路線アイコンは色数が少ないので 256 色パレット (透過込み) で十分。容量は 1/4 程度になる
+    sheet.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, "PNG", optimize=True)
+    png = buf.getvalue()
+    version = hashlib.sha1(png).hexdigest()[:10]   # 画像を差し替えたら CSS の URL も変わる
+    css = "\n".join([
+        "/* build_sprite.py で生成 (手で編集しない) */",
+        ":where(.rail-icon){height:1.6em}",   # 読込順に関係なく style.css の高さを優先させる
+        f".rail-icon{{display:inline-block;flex:none;vertical-align:middle;"
+        f"background:url(img/line_sprite.png?v={version}) no-repeat;background-size:auto 100%}}",
+        *rules,
+    ]) + "\n"
+    return png, css
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--height", type=int, default=80, help="スプライト内のアイコンの高さ px")
+    args = ap.parse_args()
+
+    png, css = build(args.height)
+    SPRITE_PNG.write_bytes(png)
+    SPRITE_CSS.write_text(css, encoding="utf-8", newline="\r\n")
+    n = css.count(".ri-")
+    print(f"{SPRITE_PNG.relative_to(BASE_DIR)}: {n} icons, {len(png) / 1024:.0f}KB")
+    print(f"{SPRITE_CSS.relative_to(BASE_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+GTFS 静的データ ➜ 発車案内用 CSV (timetable_{路線}_{曜日}_{方面}.csv)
+
+使い方
+──────────────────────────────────────────
+python gtfs_import.py FEED.zip [--route BL ...] [--date 2026-10-19] [--out DIR] [--dry-run]
+──────────────────────────────────────────
+▪ ROUTES のうち gtfs 設定のある路線 (--route で絞り込み) の乗車駅だけを取り出す
+▪ zip 内の各ファイルは 1 行ずつ読む (stop_times.txt を丸ごとメモリに載せない)
+   保持するのは対象路線の運行中の便と、対象駅に停まる行だけ
+▪ --date から 4 週間のうち、calendar_dates.txt の例外 (祝日・臨時ダイヤ) が最も少ない
+   平日 / 土曜 / 日曜 を代表日として calendar(_dates).txt を評価する
+▪ 電車は土曜と休日で同じ CSV を読むため (timetable_app._TRAIN_DAY_TAG)、holiday だけ書き出す
+▪ 出力は手作り CSV と同じ形式 (時刻,種別,行先,備考 / cp932)
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import io
+import sys
+import time
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import timetable_app as ta
+
+_WEEKDAY_COLS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_REQUIRED     = ("stops.txt", "trips.txt", "stop_times.txt")
+_SEARCH_DAYS  = 28   # 代表日を探す日数 (祝日の多い週でも各曜日区分に候補が残る長さ)
+
+
+def _rows(zf: zipfile.ZipFile, name: str):
+    """zip 内の CSV を 1 行ずつ dict で返す (ファイルが無ければ何も返さない)"""
+    if name not in zf.namelist():
+        return
+    with zf.open(name) as raw:
+        yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+
+
+@contextmanager
+def _table(zf: zipfile.ZipFile, name: str):
+    """大きいファイル用: with で (列名 ➜ 位置, 行 (list) のイテレータ)。dict を作らない分速い"""
+    with zf.open(name) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+        header = next(reader, [])
+        yield {c: i for i, c in enumerate(header)}, reader
+
+
+def exception_counts(zf: zipfile.ZipFile) -> Counter:
+    """日付 (YYYYMMDD) ➜ calendar_dates.txt の行数。祝日や臨時ダイヤの日ほど多い"""
+    return Counter(row["date"] for row in _rows(zf, "calendar_dates.txt"))
+
+
+def representative_dates(base: date, exceptions: Counter | None = None) -> dict[str, date]:
+    """
+    base から _SEARCH_DAYS 日のうち、曜日区分ごとに例外の最も少ない日 (同数なら早い日) を選ぶ
+    (曜日区分 ➜ 日付)。day_type_of は祝日を見ないので、月曜の祝日を平日の代表にしないため
+    """
+    exceptions = exceptions or Counter()
+    out: dict[str, date] = {}
+    for i in range(_SEARCH_DAYS):
+        d = base + timedelta(days=i)
+        day = ta.day_type_of(datetime(d.year, d.month, d.day))
+        if day not in out or exceptions[d.strftime("%Y%m%d")] < exceptions[out[day].strftime("%Y%m%d")]:
+            out[day] = d
+    return out
+
+
+def active_services(zf: zipfile.ZipFile, dates: dict[str, date]) -> dict[str, set[str]]:
+    """service_id ➜ 運行する曜日区分の集合 (calendar.txt + calendar_dates.txt)"""
+    services: dict[str, set[str]] = {}
+    for row in _rows(zf, "calendar.txt"):
+        start = datetime.strptime(row["start_date"], "%Y%m%d").date()
+        end   = datetime.strptime(row["end_date"], "%Y%m%d").date()
+        for day, d in dates.items():
+            if start <= d <= end and row.get(_WEEKDAY_COLS[d.weekday()]) == "1":
+                services.setdefault(row["service_id"], set()).add(day)
+
+    by_date = {d.strftime("%Y%m%d"): day for day, d in dates.items()}
+    for row in _rows(zf, "calendar_dates.txt"):
+        day = by_date.get(row["date"])
+        if day is None:
+            continue
+        if row["exception_type"] == "1":
+            services.setdefault(row["service_id"], set()).add(day)
+        elif row["exception_type"] == "2" and row["service_id"] in services:
+            services[row["service_id"]].discard(day)
+    return {sid: days for sid, days in services.items() if days}
+
+
+def target_stop_ids(zf: zipfile.ZipFile, conf: dict) -> set[str]:
+    """gtfs 設定の stop_ids / stop_names に当たる stop_id (親駅名で当たった子ホームも含む)"""
+    ids   = set(conf.get("stop_ids", []))
+    names = set(conf.get("stop_names", []))
+    parents: dict[str, str] = {}
+    for row in _rows(zf, "stops.txt"):
+        if row.get("stop_name") in names:
+            ids.add(row["stop_id"])
+        if row.get("parent_station"):
+            parents[row["stop_id"]] = row["parent_station"]
+    ids.update(sid for sid, parent in parents.items() if parent in ids)
+    return ids
+
+
+def _direction_for(r: dict, trip: dict, headsign: str) -> dict | None:
+    for d in r.get("directions", []):
+        if "gtfs_direction_id" in d and str(d["gtfs_direction_id"]) == trip["direction_id"]:
+            return d
+        if any(h in headsign for h in d.get("gtfs_headsigns", [])):
+            return d
+    return None
+
+
+def _fmt_time(t: str) -> tuple[int, str] | None:
+    """GTFS の "25:10:00" ➜ (並べ替え用の分, "1:10")"""
+    try:
+        h, m = map(int, t.split(":")[:2])
+    except ValueError:
+        return None
+    return h * 60 + m, f"{h % 24}:{m:02d}"
+
+
+def import_route(zf: zipfile.ZipFile, r: dict, services: dict[str, set[str]]) -> dict[tuple[str, str], list]:
+    """1 路線分を取り込み、(曜日区分, dest_tag) ➜ [(分, "H:MM", 種別, 行先)] を返す"""
+    conf      = r["gtfs"]
+    stops     = target_stop_ids(zf, conf)
+    route_ids = set(conf.get("route_ids", []))
+    if not stops:
+        print(f"[WARN] {r['id']}: GTFS に対象駅が見つかりません {conf}")
+        return {}
+
+    # 1) trips.txt: 対象路線で代表日に運行する便だけ残す
+    trips: dict[str, dict] = {}
+    for row in _rows(zf, "trips.txt"):
+        days = services.get(row["service_id"])
+        if not days or (route_ids and row["route_id"] not in route_ids):
+            continue
+        trips[row["trip_id"]] = {"days": days, "headsign": row.get("trip_headsign", ""),
+                                 "direction_id": row.get("direction_id", ""),
+                                 "type": row.get("trip_short_name", "")}
+
+    # 2) stop_times.txt: 1 行ずつ読み、残した便の最終停車順と対象駅の発車だけ持つ
+    last_seq: dict[str, int] = {}
+    hits: list[tuple[str, int, str, str]] = []
+    with _table(zf, "stop_times.txt") as (col, rows):
+        i_trip, i_seq, i_stop = col["trip_id"], col["stop_sequence"], col["stop_id"]
+        i_dep, i_arr = col["departure_time"], col["arrival_time"]
+        i_pick, i_head = col.get("pickup_type"), col.get("stop_headsign")
+        for row in rows:
+            trip_id = row[i_trip]
+            if trip_id not in trips:
+                continue
+            seq = int(row[i_seq])
+            if seq > last_seq.get(trip_id, -1):
+                last_seq[trip_id] = seq
+            if row[i_stop] in stops and (i_pick is None or row[i_pick] != "1"):
+                hits.append((trip_id, seq, row[i_dep] or row[i_arr],
+                             row[i_head] if i_head is not None else ""))
+
+    # 3) 終点での到着は除き、方面・曜日区分ごとに振り分ける
+    out: dict[tuple[str, str], list] = {}
+    for trip_id, seq, dep_time, stop_headsign in hits:
+        if seq >= last_seq[trip_id]:
+            continue
+        trip = trips[trip_id]
+        headsign = stop_headsign or trip["headsign"]
+        d = _direction_for(r, trip, headsign)
+        t = _fmt_time(dep_time)
+        if d is None or t is None:
+            continue
+        for day in trip["days"]:
+            out.setdefault((day, d["dest_tag"]), []).append((t[0], t[1], trip["type"], headsign))
+    for deps in out.values():
+        deps.sort()
+    return out
+
+
+def csv_path_for(r: dict, day: str, dest_tag: str, out_dir: Path) -> Path:
+    """fetch_train_schedule / fetch_bus_schedule_csv が読むファイル名"""
+    prefix = r["line_code"] if r["type"] == "train" else "BUS"
+    return out_dir / f"timetable_{prefix}_{day}_{dest_tag}.csv"
+
+
+def write_csv(path: Path, deps: list) -> None:
+    buf = io.StringIO(newline="")
+    w = csv.writer(buf, lineterminator="\r\n")
+    w.writerow(["時刻", "種別", "行先", "備考"])
+    for _, hhmm, train_type, dest in deps:
+        w.writerow([hhmm, train_type, dest, ""])
+    text = buf.getvalue()
+    try:
+        data = text.encode("cp932")        # 既存の手作り CSV に合わせる
+    except UnicodeEncodeError:
+        data = text.encode("utf-8")        # cp932 にない文字があれば UTF-8 (読込側は両対応)
+    path.write_bytes(data)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("feed", help="GTFS zip")
+    ap.add_argument("--route", action="append", help="ROUTES の id (複数可、省略時は gtfs 設定のある全路線)")
+    ap.add_argument("--date", help="代表週の開始日 YYYY-MM-DD (省略時は今日)")
+    ap.add_argument("--out", default=str(ta.DATA_DIR), help="出力先 (既定: timetable_data/)")
+    ap.add_argument("--dry-run", action="store_true", help="件数だけ表示して書き出さない")
+    args = ap.parse_args()
+
+    routes = [r for r in ta.ROUTES if r.get("gtfs") and r["type"] in ("train", "bus_csv")
+              and (not args.route or r["id"] in args.route)]
+    if not routes:
+        ap.error("gtfs 設定のある路線がありません")
+    base = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today()
+
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(args.feed) as zf:
+        missing = [n for n in _REQUIRED if n not in zf.namelist()]
+        if missing:
+            sys.exit(f"[ERROR] {args.feed}: GTFS に {', '.join(missing)} がありません")
+        dates    = representative_dates(base, exception_counts(zf))
+        services = active_services(zf, dates)
+        print(f"代表日: { {k: v.isoformat() for k, v in dates.items()} }  運行 service: {len(services)}")
+        for r in routes:
+            result = import_route(zf, r, services)
+            for (day, dest_tag), deps in sorted(result.items()):
+                if r["type"] == "train" and ta._TRAIN_DAY_TAG[day] != day:
+                    continue   # 土曜は休日の CSV を読むので書いても使われない
+                path = csv_path_for(r, day, dest_tag, Path(args.out))
+                print(f"{r['id']}: {path.name} {len(deps)}本" + (" (dry-run)" if args.dry_run else ""))
+                if not args.dry_run:
+                    write_csv(path, deps)
+    print(f"完了 {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+長時間運転の模擬 (soak test): 模擬時計で数日分のポーリングを早送りし、メモリと応答時間の推移を見る
+
+使い方
+──────────────────────────────────────────
+python soak.py [--days 5] [--warmup-days 2] [--start 2026-10-16T04:00] [--step 30]
+               [--tracemalloc] [--max-block-growth 20000] [--max-rss-growth-mb 32] [--max-p99-ratio 2.0]
+──────────────────────────────────────────
+▪ timetable_app.set_clock() で時計を差し替え、--step 秒ずつ進めながら画面 (app.js) と同じ間隔で API を呼ぶ
+   /api/timetable・/api/status は 60 秒 (ETag 付きで再検証)、/api/news は 30 秒、/api/weather は 10 分
+   画面からは使われなくなった /api/schedule (外部の表示器向け) も 60 秒、
+   /api/departures・/api/journey は 10 分ごとに呼ぶ
+▪ 上流 (ODPT・東急 HTML・天気・RSS) は手元の HTTP サーバで代用する。遅延の発生/解消・東急 API の
+   空応答 (HTML フォールバック)・天気の発表・ニュースの入れ替わりを模擬時刻に合わせて起こす
+   運行情報の文面は本物と同じく発生時刻から始める ("7時12分頃、…の影響で、約15分の遅れが…")
+▪ 模擬 1 時間ごとに p99・RSS・確保ブロック数 (sys.getallocatedblocks) を表示する
+   --tracemalloc を付けると tracemalloc の確保量も追う (遅くなるが、増えた行まで分かる)
+▪ 判定は warmup (全曜日区分を一巡してキャッシュが埋まるまで) 後の区間の前半と後半を比べる
+   ・確保ブロック数 / RSS (/ tracemalloc の確保量) の中央値の増加が閾値以上 ➜ リーク
+   ・後半の p99 が前半の --max-p99-ratio 倍以上、またはいずれかの日の 0 時台の p99 が
+     区間全体の同倍以上 ➜ 劣化 (0 時台は日ごとに判定し、曜日区分の切り替わりかどうかも表示する)
+   ・200/304 以外の応答があれば失敗
+   いずれかに当たれば終了コード 1 (--tracemalloc 時は確保量の増えた行も表示)
+▪ 既定の開始は金曜 4:00。warmup の 2 日 (金・土、日曜 0 時の切り替わりまで) で weekday / saturday /
+   holiday を一巡させ、計測区間には日 ➜ 月 (holiday ➜ weekday) の切り替わりが入る
+   計測区間に曜日区分の切り替わりが無い設定では判定しない (終了コード 2)
+▪ warm_snapshot.json は一時ディレクトリに書く (本番のファイルは触らない)
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import timetable_app as ta
+
+
+class SimClock:
+    """模擬時計 (ta.set_clock に now を渡す)"""
+
+    def __init__(self, start: datetime):
+        self.t = start
+
+    def now(self) -> datetime:
+        return self.t
+
+    def advance(self, seconds: int) -> None:
+        self.t += timedelta(seconds=seconds)
+
+
+# ──────────────────────────────────────────
+#  上流の代役
+# ──────────────────────────────────────────
+_TELOPS = ("晴れ", "晴時々曇", "曇り", "曇時々雨", "雨")
+
+
+class Upstream:
+    """ODPT・東急公式サイト・天気・RSS の代役。応答は模擬時刻から決まる"""
+
+    def __init__(self, clock: SimClock):
+        self.clock = clock
+        self.hits = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream.hits += 1
+                url = urlsplit(self.path)
+                status, ctype, body = upstream.route(url.path, parse_qs(url.query))
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):   # アクセスログは出さない
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, path: str, query: dict) -> tuple[int, str, bytes]:
+        now = self.clock.now()
+        if path.endswith("odpt:TrainInformation"):
+            op = query.get("odpt:operator", [""])[0]
+            return 200, "application/json", json.dumps(self.traininfo(op, now), ensure_ascii=False).encode()
+        if path == "/tokyu":
+            return 200, "text/html; charset=utf-8", self.tokyu_html(now).encode()
+        if path == "/weather":
+            return 200, "application/json", json.dumps(self.weather(now), ensure_ascii=False).encode()
+        if path in ("/nhk.xml", "/google.xml"):
+            return 200, "application/rss+xml; charset=utf-8", self.rss(path, now).encode()
+        return 404, "text/plain", b"not found"
+
+    @staticmethod
+    def _line_status(i: int, name: str, now: datetime) -> str:
+        """路線ごとにずらして、数時間おきに 1 時間だけ遅延や見合わせを起こす"""
+        phase = (now.hour + i) % 9
+        # 本物の文面は発生時刻から始まる。1 時間の間は文面を変えない (前の時間帯に発生した扱い)
+        since = f"{(now.hour - 1) % 24}時{i * 7 % 60:02d}分頃、"
+        if phase == 0:
+            if i % 2:
+                return f"{since}{name}内で発生した人身事故の影響で、一部列車に約{10 + now.hour % 3 * 5}分の遅れが発生しています。"
+            return f"{since}車両点検の影響で、{name}の上下線の一部列車に遅れが出ています。"
+        if phase == 4 and i % 5 == 0:
+            return f"{since}{name}内で発生した人身事故の影響で、運転を見合わせています。"
+        return "平常どおり運転しています。"
+
+    def traininfo(self, operator: str, now: datetime) -> list[dict]:
+        if operator == "odpt.Operator:Tokyu" and now.hour % 6 == 5:
+            return []        # 空応答 ➜ HTML フォールバック
+        lines = [m for m in ta.RAILWAYS.values() if m["operator"] == operator]
+        return [{"odpt:railway": m["id"],   # 本物と同じ "odpt.Railway:Tobu.Tojo" 形式
+                 "odpt:trainInformationText": {"ja": self._line_status(i, m["line"], now)}}
+                for i, m in enumerate(lines)]
+
+    def tokyu_html(self, now: datetime) -> str:
+        items = "".join(
+            f"<div class='unten_info-body-item'><div class='line'>"
+            f"<img src='/unten2/img/icon_{Path(icon or rc).stem.split('_')[-1]}.png'>"
+            f"<span class='line-name'>{name}</span></div>"
+            f"<p class='unten_info-status-text'>{self._line_status(i, name, now)}</p></div>"
+            for i, (rc, (name, icon)) in enumerate(ta.RAIL_LINES["odpt.Railway:Tokyu"].items()))
+        return (f"<!DOCTYPE html><html><head><title>運行情報</title></head><body><nav>menu</nav>"
+                f"<div class='unten_info-body'>{items}</div><footer>footer</footer></body></html>")
+
+    def weather(self, now: datetime) -> dict:
+        published = [now.replace(hour=h, minute=0, second=0, microsecond=0) for h in ta.WEATHER_PUBLISH_HOURS]
+        published = max([t for t in published if t <= now] or [published[-1] - timedelta(days=1)])
+        seed = published.toordinal() * 3 + ta.WEATHER_PUBLISH_HOURS.index(published.hour)
+        forecasts = [{
+            "dateLabel": label,
+            "telop": _TELOPS[(seed + i) % len(_TELOPS)],
+            "image": {"url": f"https://www.jma.go.jp/bosai/forecast/img/{100 + (seed + i) % 5 * 100}.svg"},
+            "chanceOfRain": {"T12_18": f"{(seed + i) % 10 * 10}%"},
+            "detail": {"wind": "北の風", "weather": "晴れ　時々　くもり" * 4},
+        } for i, label in enumerate(("今日", "明日", "明後日"))]
+        return {"publicTime": published.isoformat(), "forecasts": forecasts,
+                "description": {"text": "本文" * 500}}
+
+    def rss(self, path: str, now: datetime) -> str:
+        src = "NHK" if "nhk" in path else "Google"
+        items = "".join(f"<item><title>{src} {now:%m/%d %H}時のニュース {i}</title>"
+                        f"<link>http://example.invalid/{now:%Y%m%d%H}/{i}</link></item>" for i in range(8))
+        return (f"<?xml version='1.0' encoding='UTF-8'?><rss version='2.0'><channel>"
+                f"<title>{src}</title>{items}</channel></rss>")
+
+
+def point_app_at(upstream: Upstream, snapshot_dir: Path) -> None:
+    """timetable_app の上流 URL とスナップショットの保存先を差し替える"""
+    ta.ODPT_ENDPOINT = ta.ENDPOINT_MAIN = ta.ENDPOINT_CHALLENGE = f"{upstream.base}/odpt"
+    ta.TOKYU_URL = f"{upstream.base}/tokyu"
+    ta.W_URL     = f"{upstream.base}/weather"
+    ta.NHK       = f"{upstream.base}/nhk.xml"
+    ta.GGL       = f"{upstream.base}/google.xml"
+    ta.SNAPSHOT_FILE = snapshot_dir / "warm_snapshot.json"
+    ta._warm.clear()                # 起動時に読んだ本番のスナップショットは使わない
+
+
+# ──────────────────────────────────────────
+#  ポーリング (app.js と同じ間隔)
+# ──────────────────────────────────────────
+def make_polls(client, clock: SimClock) -> list[tuple[int, str, object]]:
+    """(間隔秒, 名前, 呼び出し) の一覧。呼び出しはレスポンスを返す"""
+    etags: dict[str, str] = {}
+
+    def get(url: str, revalidate: bool = False):
+        headers = {"If-None-Match": etags[url]} if revalidate and url in etags else {}
+        resp = client.get(url, headers=headers)
+        if revalidate and resp.status_code == 200 and resp.headers.get("ETag"):
+            etags[url] = resp.headers["ETag"]
+        return resp
+
+    stations = sorted(ta.journey_stations())
+    targets  = [(r["id"], d["column"]) for r in ta.ROUTES for d in r.get("directions", [])]
+
+    def departures():
+        now = clock.now()
+        queries = [{"route": rid, "direction": col, "from": f"{now:%H:%M}",
+                    "to": f"{now + timedelta(hours=1):%H:%M}"} for rid, col in targets]
+        return client.post("/api/departures", json={"queries": queries})
+
+    def journey():
+        now = clock.now()
+        dest = stations[(now.toordinal() * 24 + now.hour) % len(stations)] if stations else ""
+        return client.get(f"/api/journey?to={dest}")
+
+    polls = []
+    for board in ta.BOARD_ROUTES:
+        polls.append((60, f"schedule[{board}]", lambda b=board: get(f"/api/schedule?board={b}")))
+        polls.append((60, f"timetable[{board}]", lambda b=board: get(f"/api/timetable?board={b}", True)))
+    polls += [
+        (60,  "status",     lambda: get("/api/status?max_lines=2", True)),
+        (600, "weather",    lambda: get("/api/weather")),
+        (30,  "news",       lambda: get("/api/news")),
+        (600, "departures", departures),
+        (600, "journey",    journey),
+    ]
+    return polls
+
+
+def rss_mb() -> float | None:
+    """現在の常駐メモリ (MB)。/proc が無ければ最大値 (ru_maxrss) で代用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+def _p99(samples: list[float]) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(0.99 * len(samples)))]
+
+
+# ──────────────────────────────────────────
+#  実行・判定
+# ──────────────────────────────────────────
+def run(args) -> int:
+    clock    = SimClock(args.start)
+    upstream = Upstream(clock)
+    upstream.start()
+    tmpdir = tempfile.TemporaryDirectory(prefix="soak_")
+    point_app_at(upstream, Path(tmpdir.name))
+    ta.set_clock(clock.now)
+    logging.getLogger().setLevel(logging.ERROR)    # 代役が起こすフォールバックの WARNING は出さない
+
+    client = ta.app.test_client()
+    polls  = make_polls(client, clock)
+    end    = args.start + timedelta(days=args.days)
+    warmup_end = args.start + timedelta(days=args.warmup_days)
+
+    hours: list[dict] = []      # 模擬 1 時間ごとの記録
+    window: list[float] = []
+    errors: list[str] = []
+    snap_warm = None
+    due = [0] * len(polls)      # 各ポーリングの次回 (開始からの秒)
+    elapsed = 0
+    t_wall = time.perf_counter()
+    report = sys.stdout
+    print(f"{'模擬時刻':<17} {'曜日区分':<9} {'要求':>5} {'p99 ms':>8} {'RSS MB':>8} {'ブロック':>9}"
+          + (f" {'確保 MB':>8}" if args.tracemalloc else ""))
+
+    # [DEBUG] 出力は捨てる (StringIO に溜めると、それ自体が増え続けるため)
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        while clock.now() < end:
+            for i, (period, name, call) in enumerate(polls):
+                if elapsed < due[i]:
+                    continue
+                due[i] += period
+                t = time.perf_counter()
+                resp = call()
+                window.append((time.perf_counter() - t) * 1000)
+                if resp.status_code not in (200, 304):
+                    errors.append(f"{clock.now():%m/%d %H:%M} {name}: HTTP {resp.status_code}")
+                resp.close()
+
+            clock.advance(args.step)
+            elapsed += args.step
+            now = clock.now()
+            if now.minute == 0 and now.second < args.step:
+                # 応答時間は array に詰めて持つ (float のままだと計測側がブロック数を増やしてしまう)
+                rec = {"t": now - timedelta(hours=1), "n": len(window), "p99": _p99(window),
+                       "samples": array("d", window), "rss": rss_mb()}
+                window = []
+                gc.collect()
+                rec["blocks"] = sys.getallocatedblocks()
+                line = (f"{rec['t']:%m/%d(%a) %H:00}  {ta.day_type_of(rec['t']):<9} {rec['n']:>5} "
+                        f"{rec['p99']:>8.2f} {rec['rss'] or 0:>8.1f} {rec['blocks']:>9}")
+                if tracemalloc.is_tracing():
+                    rec["traced"] = tracemalloc.get_traced_memory()[0] / 2**20
+                    line += f" {rec['traced']:>8.2f}"
+                elif args.tracemalloc and now >= warmup_end:
+                    # warmup 中の読込は追わない (遅くなるだけ)。ここからの確保だけを数える
+                    tracemalloc.start(args.frames)
+                    snap_warm = tracemalloc.take_snapshot()
+                print(line, file=report, flush=True)
+                hours.append(rec)
+
+    snap_end = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+    tracemalloc.stop()
+    ta.set_clock(None)
+    upstream.stop()
+    tmpdir.cleanup()
+
+    wall = time.perf_counter() - t_wall
+    print(f"\n{args.days:g}日分 ({len(hours)}時間) を {wall:.0f}s で実行  上流への要求 {upstream.hits} 件")
+    return judge(args, [h for h in hours if h["t"] >= warmup_end], errors, snap_warm, snap_end)
+
+
+def judge(args, post: list[dict], errors: list[str], snap_warm, snap_end) -> int:
+    if len(post) < 2:
+        print("warmup 後の記録が足りません (--days を --warmup-days より大きくしてください)")
+        return 2
+    midnights = [(h, ta.day_type_of(h["t"] - timedelta(hours=1)), ta.day_type_of(h["t"]))
+                 for h in post if h["t"].hour == 0]
+    if not any(prev != cur for _, prev, cur in midnights):
+        print("warmup 後に曜日区分の切り替わりがありません (--start / --days / --warmup-days を見直してください)")
+        return 2
+    half = len(post) // 2
+    first, last = post[:half], post[half:]
+    failures = [f"HTTP エラー {len(errors)} 件 (最初: {errors[0]})"] if errors else []
+
+    def growth(key: str) -> float:
+        return statistics.median(h[key] for h in last) - statistics.median(h[key] for h in first)
+
+    print("warmup 後の前半 ➜ 後半 (中央値)")
+    blocks = growth("blocks")
+    print(f"  確保ブロック: {blocks:+.0f}  (上限 {args.max_block_growth})")
+    if blocks >= args.max_block_growth:
+        failures.append(f"確保ブロックが {blocks:.0f} 増加")
+    if all(h["rss"] is not None for h in post):
+        rss = growth("rss")
+        print(f"  RSS: {rss:+.1f}MB  (上限 {args.max_rss_growth_mb}MB)")
+        if rss >= args.max_rss_growth_mb:
+            failures.append(f"RSS が {rss:.1f}MB 増加")
+    if all("traced" in h for h in post):
+        traced = growth("traced")
+        print(f"  tracemalloc: {traced:+.2f}MB  (上限 {args.max_traced_growth_mb}MB)")
+        if traced >= args.max_traced_growth_mb:
+            failures.append(f"tracemalloc の確保量が {traced:.2f}MB 増加")
+
+    # p99: 前半 vs 後半 と 区間全体 vs 0 時台 (日付・曜日区分の切り替わり)。数 ms の揺れは無視する
+    def worse(a: float, b: float) -> bool:
+        return b >= a * args.max_p99_ratio and b - a >= args.p99_floor_ms
+
+    p_first = _p99([x for h in first for x in h["samples"]])
+    p_last  = _p99([x for h in last for x in h["samples"]])
+    p_all   = _p99([x for h in post for x in h["samples"]])
+    print(f"  p99: 前半 {p_first:.2f}ms  後半 {p_last:.2f}ms  全体 {p_all:.2f}ms")
+    if worse(p_first, p_last):
+        failures.append(f"p99 が {p_first:.2f}ms ➜ {p_last:.2f}ms に悪化")
+    for h, prev, cur in midnights:   # 日ごとに判定 (切り替わりの遅さが他の日に薄まらないように)
+        p_mid = _p99(h["samples"])
+        switch = f"{prev} ➜ {cur}" if prev != cur else cur
+        print(f"  {h['t']:%m/%d(%a)} 0時台 p99: {p_mid:.2f}ms  ({switch})")
+        if worse(p_all, p_mid):
+            failures.append(f"{h['t']:%m/%d} 0時台 ({switch}) の p99 が {p_mid:.2f}ms (全体 {p_all:.2f}ms)")
+
+    if not failures:
+        print("OK")
+        return 0
+    for f in failures:
+        print(f"FAIL: {f}")
+    if snap_warm is not None and snap_end is not None:
+        print("\n確保量の増えた箇所 (warmup 終了時 ➜ 終了時):")
+        keep = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = snap_end.filter_traces(keep).compare_to(snap_warm.filter_traces(keep), "lineno")
+        for st in stats[:10]:
+            print(f"  {st}")
+    elif not args.tracemalloc:
+        print("(--tracemalloc を付けて再実行すると、確保量の増えた行を表示します)")
+    return 1
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=float, default=5, help="模擬する日数")
+    ap.add_argument("--warmup-days", type=float, default=2, help="判定に含めない最初の日数")
+    ap.add_argument("--start", type=datetime.fromisoformat, default=datetime(2026, 10, 16, 4, 0),
+                    help="模擬開始時刻 (既定: 金曜 4:00)")
+    ap.add_argument("--step", type=int, default=30, help="時計を進める秒数 (3600 の約数)")
+    ap.add_argument("--tracemalloc", action="store_true", help="warmup 後は tracemalloc で確保量も追う (数倍遅くなる)")
+    ap.add_argument("--frames", type=int, default=1, help="tracemalloc が記録するスタック段数")
+    ap.add_argument("--max-block-growth", type=int, default=20000, help="sys.getallocatedblocks() の増加の上限")
+    ap.add_argument("--max-rss-growth-mb", type=float, default=32.0)
+    ap.add_argument("--max-traced-growth-mb", type=float, default=4.0)
+    ap.add_argument("--max-p99-ratio", type=float, default=2.0)
+    ap.add_argument("--p99-floor-ms", type=float, default=5.0, help="これ未満の p99 の差は悪化とみなさない")
+    args = ap.parse_args()
+    if args.step <= 0 or 3600 % args.step:
+        ap.error("--step は 3600 の約数にしてください")
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
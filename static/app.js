@@ -59,7 +59,7 @@ document.addEventListener("DOMContentLoaded", () => {
     const timers = new Set();          // すべての setInterval ID
     let statusArr = [], statusIdx = 0; // 運行情報
     let newsArr   = [], newsIdx   = -1;// ニュース
-    let scheduleJson = {};            // /api/schedule 結果
+    let scheduleJson = {};            // 表示中の発車案内 (/api/schedule と同じ形)
     let routesInit   = false;         // routeBox 生成済み?
     let showRoutes   = [];            // 表示路線
     let countMap     = {};            // { 路線 : 表示本数 }
@@ -124,7 +124,10 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   
     /* ─────────── 汎用 ─────────── */
-    const imgTag = fn => `<img class="logo" src="/static/img/${fn}" alt="">`;
+    // 路線アイコンはスプライト 1 枚 (line_sprite.css / build_sprite.py)。外部 URL だけ <img>
+    const imgTag = (fn, cls = "logo") => fn.startsWith("http")
+      ? `<img class="${cls}" src="${fn}" alt="">`
+      : `<span class="rail-icon ${cls} ri-${fn.replace(/\.png$/, "").replace(/\//g, "-")}"></span>`;
     const getIcons = label => {
       for(const key in ICON_MAP){
         if(label.includes(key)) return ICON_MAP[key];
@@ -173,10 +176,10 @@ document.addEventListener("DOMContentLoaded", () => {
         const li = document.createElement("li");
         li.className = "status-item";
         if (it.logo) {
-          li.insertAdjacentHTML("beforeend", `<img class="status-logo" src="${it.logo}">`);
+          li.insertAdjacentHTML("beforeend", imgTag(it.logo, "status-logo"));
         } else {
           getIcons(it.text).forEach(fn => {
-            li.insertAdjacentHTML("beforeend", `<img class="status-logo" src="/static/img/${fn}">`);
+            li.insertAdjacentHTML("beforeend", imgTag(fn, "status-logo"));
           });
         }
         li.appendChild(document.createTextNode(it.text));
@@ -203,19 +206,15 @@ document.addEventListener("DOMContentLoaded", () => {
     // サーバーから最新の運行情報を読み込む関数
     const loadStatus = () => {
       const maxLines = maxStatusLinesInput.value || 2;
-      jFetch(`/api/status?max_lines=${maxLines}`, { cache: 'no-store' })
+      // no-cache: 毎回 ETag で再検証し、変化がなければ 304 (本文なし) で済ませる
+      jFetch(`/api/status?max_lines=${maxLines}`, { cache: 'no-cache' })
         .then(data => {
           if (!data || !data.status) {
             console.error("運行情報データが不正です:", data);
             return;
           }
-          statusArr = data.status.map(item => {
-            // logoがパス文字列の場合、完全なURLを生成する
-            if (item.logo && typeof item.logo === 'string' && !item.logo.startsWith('http')) {
-              item.logo = `/static/img/${item.logo}`;
-            }
-            return item;
-          });
+          // logo は static/img/ からの相対パス (imgTag がスプライトのクラスに変換する)
+          statusArr = data.status;
           statusIdx = 0;
           if (timers.size === 0) { // 初回またはリセット後
             drawStatus();
@@ -226,18 +225,19 @@ document.addEventListener("DOMContentLoaded", () => {
     };
   
     /* ============================ 天気 ============================ */
+    // /api/weather はサーバ側で整形済み (date_label, telop, icon, rain, wind の最大3日分)
     function drawWeather(d){
       const cont = $("weather-info"); cont.innerHTML = "";
-      d.forecasts.slice(0,3).forEach(f=>{
+      (d.forecasts||[]).forEach(f=>{
         const div = document.createElement("div"); div.className="forecast-day";
         div.innerHTML = `
-          <div class="forecast-date">${f.dateLabel}</div>
+          <div class="forecast-date">${f.date_label}</div>
           <div class="forecast-main">
-            <img src="${f.image.url}" class="forecast-icon">
+            <img src="${f.icon}" class="forecast-icon">
             <span>${f.telop}</span>
           </div>
-          <div class="forecast-rain">降水確率：${f.chanceOfRain.T12_18||"--%"}</div>
-          <div class="forecast-wind">風：${f.detail.wind||""}</div>`;
+          <div class="forecast-rain">降水確率：${f.rain||"--%"}</div>
+          <div class="forecast-wind">風：${f.wind||""}</div>`;
         cont.appendChild(div);
       });
     }
@@ -306,7 +306,7 @@ document.addEventListener("DOMContentLoaded", () => {
         const wrap=document.createElement("div");   wrap.className="route-wrap";
   
         /* タイトル (ロゴ+路線名) */
-        const logoHTML=getIcons(route.label).map(imgTag).join("");
+        const logoHTML=getIcons(route.label).map(fn => imgTag(fn)).join("");
         wrap.innerHTML=`<h2 class="route-title">${logoHTML}${route.label}</h2>`;
   
         /* 時刻リスト */
@@ -337,24 +337,92 @@ document.addEventListener("DOMContentLoaded", () => {
       });
     }
   
-    function loadSchedule(){
-      fetch("/api/schedule")
+    /* ─── 時刻表はボード単位で 1 回取得し、残り時間は毎秒ローカルで計算 ─── */
+    let timetable = null;             // /api/timetable 結果 (deps に分を付加済み)
+    let scheduleKey = "";             // 直近に描画した内容 (変化がなければ再描画しない)
+
+    // JS の getDay() ➜ サーバと同じ曜日区分
+    const dayTypeOf = d => d.getDay() === 6 ? "saturday" : (d.getDay() === 0 ? "holiday" : "weekday");
+
+    function loadTimetable(){
+      const board = document.body.dataset.board || "default";
+      const day   = dayTypeOf(new Date());
+      // no-cache: ETag で再検証し、変化がなければ 304 で済ませる
+      fetch(`/api/timetable?board=${encodeURIComponent(board)}&day=${day}`, { cache: 'no-cache' })
         .then(async res => {
           if (!res.ok) {
             const text = await res.text();
-            console.error('Schedule API Error:', res.status, text);
-            throw new Error(`Schedule API returned ${res.status}`);
+            console.error('Timetable API Error:', res.status, text);
+            throw new Error(`Timetable API returned ${res.status}`);
           }
           return res.json();
         })
         .then(js => {
-          scheduleJson = js;
-          renderSchedule(js);
+          if (timetable && timetable.version === js.version && timetable.day === js.day) return;
+          js.routes.forEach(r => r.directions.forEach(d => {
+            d.deps = d.deps.map(([t, type, dest]) => {
+              const [h, m] = t.split(":").map(Number);
+              return {time: t, minute: h * 60 + m, type, dest};
+            });
+          }));
+          timetable = js;
+          tickSchedule();
         })
         .catch(err => {
           console.error('Fetch failed:', err);
         });
     }
+
+    // /api/schedule と同じ規則で表示用の文字列を組み立てる
+    function computeSchedule(tt, now){
+      const labs = ["先発", "次発", "次々発"];
+      const nowMin = now.getHours() * 60 + now.getMinutes();
+      const routes = tt.routes.map(r => {
+        const ov = r.overlay, delay = ov ? ov.delay : 0;
+        const schedules = {};
+        r.directions.forEach(d => {
+          const items = [];
+          d.deps.forEach(dep => {
+            let ahead = ((dep.minute - nowMin) % 1440 + 1440) % 1440, note = "";
+            if (ov && (ahead <= tt.overlay_window || ahead >= 1440 - delay)) {
+              ahead = (ahead + delay) % 1440; note = ov.note;
+            }
+            if (ahead === 0) return;           // ちょうど今の分 = 発車済み扱い
+            items.push([ahead - 1, dep, note]);
+          });
+          items.sort((a, b) => a[0] - b[0]);
+
+          const show = [];
+          for (const [mins, dep, note] of items) {
+            if (show.length >= r.max) break;
+            if (mins < r.run) continue;
+            const adv = mins >= r.walk ? "歩けば間に合います" : "走れば間に合います";
+            const parts = [`${dep.time}発`];
+            if (dep.type && dep.type !== "-" && dep.type !== "ー") parts.push(`【${dep.type}】`);
+            if (dep.dest && dep.dest !== "-" && dep.dest !== "ー") parts.push(`${dep.dest}行`);
+            if (note) parts.push(`(${note})`);
+            parts.push(`- ${mins}分 ${adv}`);
+            const lab = show.length < labs.length ? labs[show.length] : `${show.length + 1}本目`;
+            show.push(`${lab}: ${parts.join(" ")}`);
+          }
+          schedules[d.column] = show;
+        });
+        return {label: r.label, schedules};
+      });
+      return {board: tt.board, routes};
+    }
+
+    function tickSchedule(){
+      if (!timetable) return;
+      const now = new Date();
+      if (dayTypeOf(now) !== timetable.day) { loadTimetable(); return; }  // 曜日区分が変わった
+      const js  = computeSchedule(timetable, now);
+      const key = JSON.stringify(js.routes);
+      if (key === scheduleKey) return;
+      scheduleKey = key;
+      scheduleJson = js;
+      renderSchedule(js);
+    }
   
     /* ============================ UI バインド ============================ */
     zoomSl.addEventListener("input",()=>{
@@ -405,7 +473,8 @@ document.addEventListener("DOMContentLoaded", () => {
       addTimer(setInterval(cycleStatusPage, 4000)); // ★★★ 4秒ごとにページ切替
       addTimer(setInterval(loadStatus, 60000));
       addTimer(setInterval(loadWeather, 600000));
-      addTimer(setInterval(loadSchedule, 30000));
+      addTimer(setInterval(tickSchedule, 1000));    // 残り時間はローカル計算
+      addTimer(setInterval(loadTimetable, 60000));  // 版・遅延情報の確認 (通常は 304)
       addTimer(setInterval(loadNews, 30000));
       addTimer(setInterval(newsCycle, 4000));
     }
@@ -414,6 +483,6 @@ document.addEventListener("DOMContentLoaded", () => {
     document.body.style.zoom=zoomSl.value+"%";
     document.body.style.fontSize=fontSl.value+"%";
     resizeChk.dispatchEvent(new Event("change"));
-    updateClock();   loadStatus(); loadWeather(); loadSchedule(); loadNews();
+    updateClock();   loadStatus(); loadWeather(); loadTimetable(); loadNews();
     startTimers();
   });
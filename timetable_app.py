@@ -6,25 +6,38 @@ FULL SOURCE rev-2025-05-18  (★ CSV 対応版)
 機能
 ──────────────────────────────────────────
 ▪ 発車案内   (CSV ➜ walk/run advice)
-▪ 天気       Tsukumijima Weather JSON FULL（3日分）
+▪ 天気       Tsukumijima Weather JSON（3日分を整形・発表時刻ごとに更新）
 ▪ ニュース   NHK RSS + Google News
 ▪ 運行情報   Tokyu scrape + ODPT → 各社平常 or 異常のみ（日本語路線名＋ロゴ付き）
 ──────────────────────────────────────────
 """
 
 from __future__ import annotations
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 from pathlib import Path
+import bisect
+import gzip
+import hashlib
 import html
+import json
+import os
+import re
+import tempfile
+import threading
 import requests
 import pandas as pd
 import feedparser
-from bs4 import BeautifulSoup
-from flask import Flask, jsonify, render_template, url_for, request  # request を追加
+from bs4 import BeautifulSoup, SoupStrainer
+from flask import Flask, Response, jsonify, render_template, url_for, request, abort  # request を追加
 import requests
 import logging
 
+try:
+    import brotli  # 任意: 入っていれば br 圧縮も使う (pip install brotli)
+except ImportError:
+    brotli = None
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(message)s",
@@ -48,6 +61,144 @@ app = Flask(__name__)
 # app.config["SERVER_NAME"] = "127.0.0.1:5000"  # ← 外部アクセス対応のためコメントアウト
 app.config["PREFERRED_URL_SCHEME"] = "http"
 
+# ──────────────────────────────────────────
+#  時計 (soak.py などで模擬時計に差し替える)
+# ──────────────────────────────────────────
+_clock = datetime.now
+
+
+def current_time() -> datetime:
+    """発車案内・曜日判定・取り直し時刻などに使う現在時刻 (ローカル時刻, naive)"""
+    return _clock()
+
+
+def set_clock(fn=None) -> None:
+    """現在時刻の取得関数を差し替える (None で datetime.now に戻す)"""
+    global _clock
+    _clock = fn or datetime.now
+
+# ──────────────────────────────────────────
+#  HTTP キャッシュ : ETag / Last-Modified / 圧縮
+# ──────────────────────────────────────────
+COMPRESS_MIN_SIZE  = 512                      # これ未満の本文は圧縮しない (bytes)
+COMPRESS_MIMETYPES = ("application/json", "text/css", "text/javascript",
+                      "application/javascript", "text/html")
+STATIC_MAX_AGE     = 365 * 24 * 3600          # ?v=<hash> 付き静的ファイルのキャッシュ秒数
+
+_api_last_modified: dict[str, tuple[str, datetime]] = {}  # path?query ➜ (ETag, 内容が変わった時刻)
+_api_compressed: dict[tuple[str, str], bytes] = {}         # (ETag, encoding) ➜ 圧縮済み本文
+_API_CACHE_LIMIT = 256
+
+
+def _choose_encoding() -> str | None:
+    """Accept-Encoding から使う圧縮方式を決める (br > gzip)"""
+    accept = request.headers.get("Accept-Encoding", "")
+    if brotli is not None and "br" in accept:
+        return "br"
+    if "gzip" in accept:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+@lru_cache(maxsize=None)
+def _static_fingerprint(filename: str, mtime: float) -> str:
+    """静的ファイルの内容ハッシュ (mtime が変われば再計算)"""
+    return hashlib.md5((STATIC_DIR / filename).read_bytes()).hexdigest()[:10]
+
+
+@lru_cache(maxsize=64)
+def _static_precompressed(filename: str, mtime: float, encoding: str) -> bytes:
+    """CSS/JS などの圧縮済みバイト列 (ファイル更新までは 1 回だけ圧縮)"""
+    return _compress((STATIC_DIR / filename).read_bytes(), encoding)
+
+
+@app.url_defaults
+def _static_cache_buster(endpoint: str, values: dict) -> None:
+    """url_for('static', ...) に ?v=<内容ハッシュ> を自動付与する"""
+    if endpoint != "static" or "v" in values:
+        return
+    path = STATIC_DIR / values.get("filename", "")
+    if path.is_file():
+        values["v"] = _static_fingerprint(values["filename"], path.stat().st_mtime)
+
+
+def _cache_api_response(resp):
+    """/api/* : 本文ハッシュの ETag + Last-Modified を付け、条件付き GET なら 304"""
+    body = resp.get_data()
+    etag = hashlib.sha1(body).hexdigest()
+
+    key  = request.full_path
+    prev = _api_last_modified.get(key)
+    if prev and prev[0] == etag:
+        last_mod = prev[1]
+    else:
+        if len(_api_last_modified) >= _API_CACHE_LIMIT:
+            _api_last_modified.clear()
+        last_mod = datetime.now(timezone.utc).replace(microsecond=0)
+        _api_last_modified[key] = (etag, last_mod)
+
+    enc = _choose_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    resp.set_etag(f"{etag}-{enc}" if enc else etag)
+    resp.last_modified = last_mod
+    resp.cache_control.no_cache = True   # 毎回再検証させる (変化なしなら 304 で本文ゼロ)
+    resp.vary.add("Accept-Encoding")
+    resp.make_conditional(request)
+
+    if resp.status_code == 200 and enc:
+        packed = _api_compressed.get((etag, enc))
+        if packed is None:
+            if len(_api_compressed) >= _API_CACHE_LIMIT:
+                _api_compressed.clear()
+            packed = _api_compressed[(etag, enc)] = _compress(body, enc)
+        resp.set_data(packed)
+        resp.headers["Content-Encoding"] = enc
+    return resp
+
+
+def _cache_static_response(resp):
+    """static/ : フィンガープリント付きなら長期キャッシュ、テキスト系は圧縮済みを返す"""
+    if request.args.get("v"):
+        resp.cache_control.no_cache  = None
+        resp.cache_control.public    = True
+        resp.cache_control.max_age   = STATIC_MAX_AGE
+        resp.cache_control.immutable = True
+
+    filename = (request.view_args or {}).get("filename", "")
+    path = STATIC_DIR / filename
+    enc  = _choose_encoding()
+    if (not enc or resp.mimetype not in COMPRESS_MIMETYPES or not path.is_file()
+            or path.stat().st_size < COMPRESS_MIN_SIZE):
+        return resp
+
+    tag, _ = resp.get_etag()
+    if tag:
+        resp.set_etag(f"{tag}-{enc}")
+    resp.vary.add("Accept-Encoding")
+    resp.make_conditional(request)
+    if resp.status_code == 200:
+        resp.direct_passthrough = False
+        resp.set_data(_static_precompressed(filename, path.stat().st_mtime, enc))
+        resp.headers["Content-Encoding"] = enc
+    return resp
+
+
+@app.after_request
+def _http_cache(resp):
+    # ストリーミング応答 (POST /api/departures?format=ndjson) はメソッドの判定で対象外になる
+    if request.method not in ("GET", "HEAD") or resp.status_code != 200:
+        return resp
+    if request.endpoint == "static":
+        return _cache_static_response(resp)
+    if request.path.startswith("/api/"):
+        return _cache_api_response(resp)
+    return resp
+
 # ──────────────────────────────────────────
 #  ユーティリティ : 電車 (CSV)
 # ──────────────────────────────────────────
@@ -59,15 +210,31 @@ _DAY_MAP = {   # datetime.weekday() ➜ ファイル名用タグ
     6: "holiday",
 }
 
-def fetch_train_schedule(line_code: str, dest_tag: str) -> list[dict[str, str]]:
+DAY_TYPES = ("weekday", "saturday", "holiday")   # 一括照会 API などで使う曜日区分
+_TRAIN_DAY_TAG = {"weekday": "weekday", "saturday": "holiday", "holiday": "holiday"}  # 区分 ➜ 電車CSVタグ
+
+
+def day_type_of(dt: datetime) -> str:
+    """日時 ➜ 曜日区分 ("weekday" / "saturday" / "holiday")"""
+    wd = dt.weekday()
+    if wd < 5:
+        return "weekday"
+    return "saturday" if wd == 5 else "holiday"
+
+
+def fetch_train_schedule(line_code: str, dest_tag: str, day_type: str | None = None) -> list[dict[str, str]]:
     """
     指定された路線の電車時刻表を CSV から読み込んで
     {"time": "HH:MM", "type": "種別", "dest": "行き先"} の辞書のリストを返す
       line_code: "OM", "TY", "MG", "BL" など
       dest_tag : "Ooimachi", "Mizonokuchi", "Shibuya", "Yokohama", "Meguro", "Hiyoshi", "Azamino", "Shonandai" など
+      day_type : DAY_TYPES のいずれか (省略時は今日)
     """
     # 1) 対象 CSV ファイル決定
-    today_tag = _DAY_MAP[datetime.now().weekday()]
+    if day_type is None:
+        today_tag = _DAY_MAP[current_time().weekday()]
+    else:
+        today_tag = _TRAIN_DAY_TAG[day_type]
     csv_path  = DATA_DIR / f"timetable_{line_code}_{today_tag}_{dest_tag}.csv"
 
     # ブルーライン用のデバッグ出力を追加
@@ -195,41 +362,27 @@ def fetch_bus_schedule(sheet: str, col: str, path: Path) -> list[str]:
     return out
 
 
-def sheet_name(kind: str, key: str | None = None) -> str:
-    """曜日判定してシート名を返すヘルパ（バス用のみ）"""
-    wd = datetime.now().weekday()
+def sheet_name(kind: str, key: str | None = None, day_type: str | None = None) -> str:
+    """曜日判定してシート名を返すヘルパ（バス用のみ, day_type 省略時は今日）"""
+    day = day_type or day_type_of(current_time())
     if kind in ("bus", "bus_2"):
-        return f"{'平日' if wd < 5 else '土休日'}_{key}"
+        return f"{'平日' if day == 'weekday' else '土休日'}_{key}"
     if kind == "bus_3":
-        if wd < 5:
+        if day == "weekday":
             return f"平日_{key}"
-        if wd == 5:
+        if day == "saturday":
             return f"土曜_{key}"
         return f"日休日_{key}"
     raise ValueError("kind error")
 
 
-def remaining(dep_time: str) -> timedelta:
-    """HH:MM 形式 ➜ 出発までの残り time delta"""
-    now = datetime.now()
-    dep = datetime.strptime(dep_time, "%H:%M").replace(year=now.year, month=now.month, day=now.day)
-    if dep < now:
-        dep += timedelta(days=1)
-    return dep - now
-
-
-def fetch_bus_schedule_csv(bus_type: str, dest_tag: str) -> list[dict[str, str]]:
+def fetch_bus_schedule_csv(bus_type: str, dest_tag: str, day_type: str | None = None) -> list[dict[str, str]]:
     """
     バス時刻表をCSVから読み込んで電車と同じ形式で返す
     {"time": "HH:MM", "type": "", "dest": "行き先"} の辞書のリスト
     """
-    # 曜日に応じたファイル選択
-    wd = datetime.now().weekday()
-    day_tag = "weekday"
-    if wd == 5:  # 土曜日
-        day_tag = "saturday"
-    elif wd == 6:  # 日曜日
-        day_tag = "holiday"
+    # 曜日に応じたファイル選択 (weekday / saturday / holiday)
+    day_tag = day_type or day_type_of(current_time())
     
     # CSVファイルパス
     csv_path = DATA_DIR / f"timetable_BUS_{day_tag}_{dest_tag}.csv"
@@ -299,50 +452,77 @@ def fetch_bus_schedule_csv(bus_type: str, dest_tag: str) -> list[dict[str, str]]
 # ──────────────────────────────────────────
 #  発車案内ルート定義
 # ──────────────────────────────────────────
+# railway : ODPT 路線ID (運行情報の遅延を発車案内に反映するキー)
+# stop : 乗車する駅・停留所名 (乗換検索で駅を同一視するキー)
+# ride : 方面ごとの {降車駅: 乗車駅からの所要分} (概算、乗換検索用)
+# gtfs : GTFS 取込 (gtfs_import.py) 用。路線側に stop_names / stop_ids / route_ids、
+#        方面側に gtfs_headsigns (行先の部分一致) か gtfs_direction_id を書く
 ROUTES = [
     dict(
+        id="OM",
         label="東急大井町線　尾山台駅",
         type="train",
         line_code="OM",
+        railway="odpt.Railway:Tokyu.Oimachi",
+        stop="尾山台",
         directions=[
-            dict(column="大井町方面", dest_tag="Ooimachi"),
-            dict(column="溝の口方面", dest_tag="Mizonokuchi"),
+            dict(column="大井町方面", dest_tag="Ooimachi",
+                 ride={"九品仏": 2, "自由が丘": 4, "大岡山": 8, "旗の台": 11, "大井町": 19}),
+            dict(column="溝の口方面", dest_tag="Mizonokuchi",
+                 ride={"等々力": 2, "上野毛": 4, "二子玉川": 7, "溝の口": 12}),
         ],
         max=3,
         walk=14,
         run=10,
     ),
     dict(
+        id="TY",
         label="東急東横線　田園調布駅", # ラベル変更
         type="train",
         line_code="TY",
+        railway="odpt.Railway:Tokyu.Toyoko",
+        stop="田園調布",
         directions=[
-            dict(column="渋谷方面", dest_tag="Shibuya"),
-            dict(column="横浜方面", dest_tag="Yokohama"),
+            dict(column="渋谷方面", dest_tag="Shibuya",
+                 ride={"自由が丘": 3, "学芸大学": 7, "中目黒": 11, "渋谷": 16}),
+            dict(column="横浜方面", dest_tag="Yokohama",
+                 ride={"多摩川": 2, "武蔵小杉": 5, "日吉": 10, "菊名": 15, "横浜": 24}),
         ],
         max=3,
         walk=30, # 所要時間変更
         run=25,  # 所要時間変更
     ),
     dict(
+        id="MG",
         label="東急目黒線　田園調布駅", # ラベル変更
         type="train",
         line_code="MG",
+        railway="odpt.Railway:Tokyu.Meguro",
+        stop="田園調布",
         directions=[
-            dict(column="目黒方面", dest_tag="Meguro"),
-            dict(column="日吉方面", dest_tag="Hiyoshi"),
+            dict(column="目黒方面", dest_tag="Meguro",
+                 ride={"奥沢": 2, "大岡山": 4, "武蔵小山": 8, "目黒": 13}),
+            dict(column="日吉方面", dest_tag="Hiyoshi",
+                 ride={"多摩川": 2, "武蔵小杉": 5, "日吉": 10}),
         ],
         max=3,
         walk=30, # 所要時間変更
         run=25,  # 所要時間変更
     ),
     dict(
+        id="BL",
         label="横浜市営地下鉄・ブルーライン 中川駅",
         type="train",
         line_code="BL", # ブルーラインの路線コード (仮)
+        railway="odpt.Railway:YokohamaMunicipal.Blue",
+        stop="中川",
+        gtfs=dict(stop_names=["中川"]),
         directions=[
-            dict(column="あざみ野方面", dest_tag="Azamino"),
-            dict(column="湘南台方面", dest_tag="Shonandai"),
+            dict(column="あざみ野方面", dest_tag="Azamino",
+                 ride={"あざみ野": 3}, gtfs_headsigns=["あざみ野"]),
+            dict(column="湘南台方面", dest_tag="Shonandai",
+                 ride={"センター北": 2, "センター南": 4, "新横浜": 14, "横浜": 24, "湘南台": 42},
+                 gtfs_headsigns=["湘南台", "踊場", "上永谷", "下飯田"]),
         ],
         max=3, # 表示件数 (他に合わせて3件)
         walk=15,
@@ -350,35 +530,41 @@ ROUTES = [
     ),
     # --- ここから追加 ---
     dict(
+        id="tama11",
         label="玉11　東京都市大学南入口",
         type="bus",
         file=bus_timetable_file,
+        stop="東京都市大学南入口",
         directions=[
-            dict(column="多摩川駅方面", sheet_direction="多摩川"),
-            dict(column="二子玉川駅方面", sheet_direction="二子玉川"),
+            dict(column="多摩川駅方面", sheet_direction="多摩川", ride={"多摩川": 12}),
+            dict(column="二子玉川駅方面", sheet_direction="二子玉川", ride={"二子玉川": 15}),
         ],
         max=2,
         walk=7,
         run=5,
     ),
     dict(
+        id="en02",
         label="園02　東京都市大学北入口",
         type="bus_3",
         file=bus_timetable_file3,
+        stop="東京都市大学北入口",
         directions=[
-            dict(column="千歳船橋駅方面", sheet_direction="千歳船橋"),
-            dict(column="田園調布方面", sheet_direction="田園調布"),
+            dict(column="千歳船橋駅方面", sheet_direction="千歳船橋", ride={"千歳船橋": 20}),
+            dict(column="田園調布方面", sheet_direction="田園調布", ride={"田園調布": 15}),
         ],
         max=2,
         walk=7,
         run=5,
     ),
     dict(
+        id="todo01",
         label="等01　東京都市大学前",
         type="bus_2",
         file=bus_timetable_file2,
+        stop="東京都市大学前",
         directions=[
-            dict(column="等々力循環", sheet_direction="等々力"),
+            dict(column="等々力循環", sheet_direction="等々力", ride={"等々力": 8}),
         ],
         max=2,
         walk=7,
@@ -386,11 +572,13 @@ ROUTES = [
     ),
     # --- ここから追加 ---
     dict(
+        id="chotokuji",
         label="東急バス　長徳寺前",
         type="bus_csv",
+        stop="長徳寺前",
         directions=[
-            dict(column="鷺沼駅方面", dest_tag="Saginuma"),
-            dict(column="センター北駅方面", dest_tag="CenterKita"),
+            dict(column="鷺沼駅方面", dest_tag="Saginuma", ride={"鷺沼": 12}),
+            dict(column="センター北駅方面", dest_tag="CenterKita", ride={"センター北": 15}),
         ],
         max=3,
         walk=10,
@@ -399,88 +587,755 @@ ROUTES = [
     # --- ここまで追加 ---
 ]
 
+# ──────────────────────────────────────────
+#  発車案内ボード定義
+# ──────────────────────────────────────────
+# ボード名 ➜ 表示する路線 (ROUTES の id) の並び。
+# 路線は id 文字列か、walk/run/max を上書きする dict(id=..., walk=..., ...) で指定する。
+BOARDS_FILE   = BASE_DIR / "boards.json"   # あれば読み込んで BOARDS に追加・上書き
+DEFAULT_BOARD = "default"
+BOARD_OVERRIDE_KEYS = ("walk", "run", "max")
+
+BOARDS = {
+    DEFAULT_BOARD: [r["id"] for r in ROUTES],
+}
+
+
+def load_boards() -> dict[str, list[dict]]:
+    """BOARDS (+ boards.json) を解決し、ボード名 ➜ 上書き適用済みルート dict のリストを返す"""
+    boards = dict(BOARDS)
+    if BOARDS_FILE.exists():
+        try:
+            extra = json.loads(BOARDS_FILE.read_text(encoding="utf-8"))
+        except Exception as e:
+            logging.error(f"boards.json read error: {e}")
+        else:
+            if isinstance(extra, dict):
+                boards.update(extra)
+            else:
+                logging.error(f"boards.json must be an object of board name ➜ list, got {type(extra).__name__}")
+
+    by_id = {r["id"]: r for r in ROUTES}
+    resolved: dict[str, list[dict]] = {}
+    for name, entries in boards.items():
+        if not isinstance(entries, list):
+            logging.warning(f"board '{name}': entries must be a list, got {type(entries).__name__}")
+            continue
+        routes = []
+        for ent in entries:
+            if isinstance(ent, str):
+                ent = {"id": ent}
+            if not isinstance(ent, dict):
+                logging.warning(f"board '{name}': entry must be a route id or object, got {ent!r}")
+                continue
+            rid  = ent.get("id")
+            base = by_id.get(rid) if isinstance(rid, str) else None
+            if base is None:
+                logging.warning(f"board '{name}': unknown route id {ent.get('id')!r}")
+                continue
+            try:
+                over = {k: int(ent[k]) for k in BOARD_OVERRIDE_KEYS if k in ent}
+            except (TypeError, ValueError) as e:
+                logging.warning(f"board '{name}': invalid override for {ent['id']!r}: {e}")
+                continue
+            routes.append({**base, **over})
+        resolved[name] = routes
+    return resolved
+
+
+BOARD_ROUTES = load_boards()
+
+# ──────────────────────────────────────────
+#  発車案内 : 運行情報 (遅延) の反映
+# ──────────────────────────────────────────
+# /api/status で取得した運行情報を railway ID で ROUTES に突き合わせ、
+# 状態が変わった路線のスナップショットだけを捨てて次回作り直す。
+OVERLAY_TTL    = timedelta(minutes=10)   # これより古い運行情報は反映しない
+OVERLAY_WINDOW = 120                     # 今から何分先の発車まで遅延を反映するか
+
+ROUTES_BY_RAILWAY: dict[str, list[str]] = {}   # railway ➜ [路線id]
+for _r in ROUTES:
+    if _r.get("railway"):
+        ROUTES_BY_RAILWAY.setdefault(_r["railway"], []).append(_r["id"])
+
+_line_status: dict[str, tuple[dict | None, datetime]] = {}   # railway ➜ (overlay, 更新時刻)
+
+
+# 遅れそのものの分数だけを拾う ("8時05分頃、" のような発生時刻は対象外)
+_DELAY_MINUTES_RE = re.compile(r"(?<![時\d])(\d+)分(?:程度|以上|前後|ほど)?の?(?:遅れ|遅延)")
+
+
+def parse_delay(text: str) -> dict | None:
+    """
+    運行情報テキスト ➜ {"delay": ずらす分, "note": 注記}。平常なら None
+
+    >>> parse_delay("平常どおり運転しています。")
+    >>> parse_delay("8時05分頃、渋谷駅で発生した人身事故の影響で、一部列車に遅れが出ています。")
+    {'delay': 0, 'note': '遅延あり'}
+    >>> parse_delay("7時48分頃、車両点検の影響で、上下線の一部列車に最大15分程度の遅れが出ています。")
+    {'delay': 15, 'note': '約15分遅れ'}
+    >>> parse_delay("信号確認の影響で、約10分の遅れが発生しています。")
+    {'delay': 10, 'note': '約10分遅れ'}
+    >>> parse_delay("12時30分頃、大雨の影響で、20分以上の遅延が発生しています。")
+    {'delay': 20, 'note': '約20分遅れ'}
+    >>> parse_delay("15時20分頃、人身事故の影響で、運転を見合わせています。")
+    {'delay': 0, 'note': '運転見合わせ'}
+    >>> parse_delay("強風の影響で、ダイヤが乱れています。")
+    {'delay': 0, 'note': '運行情報あり'}
+    """
+    if not text or "平常" in text:
+        return None
+    if "見合わせ" in text:
+        return {"delay": 0, "note": "運転見合わせ"}
+    m = _DELAY_MINUTES_RE.search(text)
+    if m:
+        n = int(m.group(1))
+        return {"delay": n, "note": f"約{n}分遅れ"}
+    if "遅" in text:
+        return {"delay": 0, "note": "遅延あり"}
+    return {"delay": 0, "note": "運行情報あり"}
+
+
+def update_line_status(infos: list[dict], now: datetime | None = None) -> set[str]:
+    """
+    運行情報 (fetch_*_traininfo の結果) を取り込み、状態が変わった路線idを返す。
+    変わった路線のスナップショットだけを無効化する。
+    """
+    now = now or current_time()
+    changed: set[str] = set()
+    for ent in infos:
+        rw = ent.get("railway")
+        if rw not in ROUTES_BY_RAILWAY:
+            continue
+        ov = parse_delay(ent.get("status", ""))
+        prev = _line_status.get(rw)
+        _line_status[rw] = (ov, now)
+        if prev is None or prev[0] != ov:
+            changed.update(ROUTES_BY_RAILWAY[rw])
+    if changed:
+        with _snapshot_lock:
+            for key in [k for k in _snapshot_cache if k[0] in changed]:
+                del _snapshot_cache[key]
+        logging.info(f"運行情報の変化を発車案内に反映: {sorted(changed)}")
+    return changed
+
+
+def line_overlay(r: dict, now: datetime) -> dict | None:
+    """路線の現在の遅延 overlay (なし・期限切れなら None)"""
+    hit = _line_status.get(r.get("railway"))
+    if not hit or now - hit[1] > OVERLAY_TTL:
+        return None
+    return hit[0]
+
+
+# ──────────────────────────────────────────
+#  発車案内 : 方面ごとのスナップショット (全ボード共有・1分ごと)
+# ──────────────────────────────────────────
+_snapshot_cache: dict[tuple[str, str], tuple[str, list]] = {}  # (路線id, 方面) ➜ (分キー, 一覧)
+_snapshot_lock  = threading.Lock()
+
+
+def load_direction_schedule(r: dict, d: dict, day_type: str | None = None) -> list:
+    """路線種別に応じて 1 方面分の時刻表を読み込む (day_type 省略時は今日)"""
+    if r["type"] == "train":
+        return fetch_train_schedule(r["line_code"], d["dest_tag"], day_type)
+    if r["type"] == "bus_csv":
+        return fetch_bus_schedule_csv(r["type"], d["dest_tag"], day_type)
+    sh = sheet_name(r["type"], d.get("sheet_direction"), day_type)
+    return fetch_bus_schedule(sh, d["column"], r["file"])
+
+
+def direction_snapshot(r: dict, d: dict, now: datetime) -> list[tuple[int, str, dict, str]]:
+    """
+    now の「分」時点での (残り分, "HH:MM", 元データ, 運行情報注記) を残り時間順に返す。
+    結果は路線id・方面ごとに 1 分間キャッシュされ、全ボードで共有される。
+    残り分は now の分内 (秒 > 0) で見た値 = 出発時刻までの分差 - 1。
+    路線に遅延情報があれば、OVERLAY_WINDOW 分以内の発車をその分だけ後ろにずらして数える。
+    時刻表は timetable_index (ファイル更新時刻で作り直す) から取り、ロックの外で読む。
+    """
+    minute_key = now.strftime("%Y-%m-%d %H:%M")
+    key = (r["id"], d["column"])
+    with _snapshot_lock:
+        hit = _snapshot_cache.get(key)
+    if hit and hit[0] == minute_key:
+        return hit[1]
+
+    _, deps = timetable_index(r["id"], d["column"], day_type_of(now), timetable_data_version())
+    # 組み立ては遅延情報の無効化 (update_line_status) と食い違わないようロック内で行う
+    with _snapshot_lock:
+        overlay = line_overlay(r, now)
+        delay   = overlay["delay"] if overlay else 0
+        note    = overlay["note"] if overlay else ""
+        now_min = now.hour * 60 + now.minute
+        out = []
+        for item in deps:
+            time_str = item["time"]
+            ahead = (item["minute"] - now_min) % 1440
+            if overlay and (ahead <= OVERLAY_WINDOW or ahead >= 1440 - delay):
+                ahead = (ahead + delay) % 1440   # 定刻を過ぎた遅延列車もここで戻ってくる
+                item_note = note
+            else:
+                item_note = ""
+            if ahead == 0:   # ちょうど今の分 = 発車済み扱い
+                continue
+            out.append((ahead - 1, time_str, item, item_note))
+        out.sort(key=lambda x: x[0])
+        _snapshot_cache[key] = (minute_key, out)
+        return out
+
+
 # ──────────────────────────────────────────
 #  API: 発車案内
 # ──────────────────────────────────────────
+_LABS = ["先発", "次発", "次々発"]
+
+
+def build_route_entry(r: dict, now: datetime) -> dict:
+    """共有スナップショットから、このボードの walk/run/max で 1 路線分の表示を組み立てる"""
+    ent = {"label": r["label"]}
+    mp = {}
+    for d in r.get("directions", []):
+        show = []
+        for mins, current_time_str, item, note in direction_snapshot(r, d, now):
+            if len(show) >= r["max"]:
+                break
+            if mins < r["run"]:
+                continue
+            adv = "歩けば間に合います" if mins >= r["walk"] else "走れば間に合います"
+            display_parts = [f"{current_time_str}発"]
+            if isinstance(item, dict):
+                train_type = item.get("type", "").strip()
+                destination = item.get("dest", "").strip()
+                if train_type and train_type not in ["-", "ー"]:
+                    display_parts.append(f"【{train_type}】")
+                if destination and destination not in ["-", "ー"]:
+                    display_parts.append(f"{destination}行")
+            if note:
+                display_parts.append(f"({note})")
+            display_parts.append(f"- {mins}分 {adv}")
+            lab = _LABS[len(show)] if len(show) < len(_LABS) else f"{len(show) + 1}本目"
+            show.append(f"{lab}: {' '.join(display_parts)}")
+        mp[d["column"]] = show
+    ent["schedules"] = mp
+    return ent
+
+
 @app.route("/api/schedule")
 def api_schedule():
-    labs = ["先発", "次発", "次々発"]
-    res = {"current_time": datetime.now().strftime("%H:%M:%S"), "routes": []}
+    board = request.args.get("board", DEFAULT_BOARD)
+    routes = BOARD_ROUTES.get(board)
+    if routes is None:
+        abort(404)
+
+    now = current_time()
+    # 表示は分単位で変わる。秒まで入れると本文 (ETag) が毎秒変わり、同じ分の再取得が 304 にならない
+    res = {"current_time": now.strftime("%H:%M"), "board": board, "routes": []}
+    for r in routes:
+        res["routes"].append(build_route_entry(r, now))
+    return jsonify(res)
+
+
+@app.route("/api/boards")
+def api_boards():
+    return jsonify({"boards": {name: [r["id"] for r in routes]
+                               for name, routes in BOARD_ROUTES.items()}})
+
+# ──────────────────────────────────────────
+#  時刻表インデックス (路線id・方面・曜日区分ごと)
+# ──────────────────────────────────────────
+ROUTE_BY_ID = {r["id"]: r for r in ROUTES}
 
-    for r in ROUTES:
-        # travel = "(所要時間:15分)" if r["type"] == "train" else "(所要時間:10分)" # この行は削除またはコメントアウト
-        # label = f"{r['label']} {travel}" # この行は削除またはコメントアウト
-        # label は ROUTES で定義されたものをそのまま使うか、所要時間を動的に表示するなら別途考慮
-        ent = {"label": r['label']} # travel情報を削除
-        mp = {}
 
+def find_direction(r: dict, key: str) -> dict | None:
+    """方面を column / dest_tag / sheet_direction のいずれかで引く (空・None は不一致)"""
+    if not key:   # dest_tag の無いバス路線の方面に None が当たらないように
+        return None
+    for d in r.get("directions", []):
+        if key in (d.get("column"), d.get("dest_tag"), d.get("sheet_direction")):
+            return d
+    return None
+
+
+def timetable_data_version() -> float:
+    """timetable_data/ の最終更新時刻 (ファイル差し替えでインデックスを作り直すためのキー)"""
+    return max((p.stat().st_mtime for p in DATA_DIR.iterdir()), default=0.0)
+
+
+@lru_cache(maxsize=256)
+def timetable_index(route_id: str, column: str, day_type: str, version: float) -> tuple[list[int], list[dict]]:
+    """
+    1 方面・1 曜日区分の発車を 0:00 からの分で昇順に並べたインデックス。
+    (分リスト, 発車 dict リスト) を返し、時間帯検索は bisect で行う。
+    """
+    r = ROUTE_BY_ID[route_id]
+    d = find_direction(r, column)
+    deps = []
+    for item in load_direction_schedule(r, d, day_type):
+        if isinstance(item, str):
+            item = {"time": item, "type": "", "dest": ""}
+        try:
+            h, m = map(int, item["time"].split(":"))
+        except (KeyError, ValueError):
+            continue
+        deps.append({"time": item["time"], "minute": h * 60 + m,
+                     "type": item.get("type", ""), "dest": item.get("dest", "")})
+    deps.sort(key=lambda x: x["minute"])
+    return [x["minute"] for x in deps], deps
+
+
+# ──────────────────────────────────────────
+#  API: 時刻表一括照会
+# ──────────────────────────────────────────
+# POST /api/departures
+#   {"queries": [{"route": "OM", "direction": "大井町方面", "day": "weekday",
+#                 "from": "17:00", "to": "19:00", "limit": 100}, ...]}
+#   day 省略時は今日の区分、from/to 省略時は終日、from > to なら日付またぎ。
+#   ?format=ndjson で 1 行 1 発車のストリーム出力 (大きな時間帯向け)。
+MAX_QUERIES            = 100     # 1 リクエストあたりの照会数
+MAX_DEPARTURES_JSON    = 5000    # JSON 応答全体の発車数上限
+MAX_DEPARTURES_STREAM  = 100000  # NDJSON 応答全体の発車数上限
+DEFAULT_QUERY_LIMIT    = 500     # 照会ごとの既定件数
+
+
+def _parse_hhmm(text: str | None, default: int) -> int:
+    if text is None:
+        return default
+    h, m = map(int, str(text).split(":"))
+    if not (0 <= h <= 24 and 0 <= m < 60):
+        raise ValueError(text)
+    return h * 60 + m
+
+
+def query_departures(q: dict, version: float, today: str) -> tuple[dict, list[dict]]:
+    """
+    照会 1 件を解決して (ヘッダ, 発車リスト) を返す。不正な照会はヘッダに error を入れる。
+    発車リストは limit 件で打ち切り、超えた場合はヘッダの truncated を True にする。
+    """
+    head = {"route": q.get("route"), "direction": q.get("direction"), "day": q.get("day") or today}
+    bad = [k for k in ("route", "direction", "day") if head[k] is not None and not isinstance(head[k], str)]
+    if bad:   # 辞書引きの前に弾く (リストなどは unhashable で 500 になる)
+        return {**head, "error": f"{'/'.join(bad)} must be a string"}, []
+    r = ROUTE_BY_ID.get(q.get("route"))
+    if r is None:
+        return {**head, "error": "unknown route"}, []
+    d = find_direction(r, q.get("direction", ""))
+    if d is None:
+        return {**head, "error": "unknown direction"}, []
+    if head["day"] not in DAY_TYPES:
+        return {**head, "error": f"day must be one of {list(DAY_TYPES)}"}, []
+    try:
+        start = _parse_hhmm(q.get("from"), 0)
+        end   = _parse_hhmm(q.get("to"), 24 * 60)
+        limit = int(q.get("limit", DEFAULT_QUERY_LIMIT))
+    except (TypeError, ValueError):
+        return {**head, "error": "invalid from/to/limit"}, []
+    head.update({"direction": d["column"], "from": q.get("from"), "to": q.get("to")})
+
+    minutes, deps = timetable_index(r["id"], d["column"], head["day"], version)
+    if start <= end:
+        spans = [(start, end)]
+    else:                         # 日付またぎ (例 23:00 → 01:00)
+        spans = [(start, 24 * 60), (0, end)]
+    out = []
+    for lo, hi in spans:
+        out.extend(deps[bisect.bisect_left(minutes, lo):bisect.bisect_left(minutes, hi)])
+    head["truncated"] = len(out) > limit
+    return head, out[:max(limit, 0)]
+
+
+@app.route("/api/departures", methods=["POST"])
+def api_departures():
+    body = request.get_json(silent=True)
+    queries = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "queries must be a non-empty list"}), 400
+    if len(queries) > MAX_QUERIES:
+        return jsonify({"error": f"too many queries (max {MAX_QUERIES})"}), 400
+
+    version = timetable_data_version()
+    today   = day_type_of(current_time())
+
+    if request.args.get("format") == "ndjson":
+        def stream():
+            budget = MAX_DEPARTURES_STREAM
+            for i, q in enumerate(queries):
+                head, deps = query_departures(q if isinstance(q, dict) else {}, version, today)
+                if len(deps) > budget:
+                    deps, head["truncated"] = deps[:budget], True
+                budget -= len(deps)
+                yield json.dumps({"query": i, **head}, ensure_ascii=False) + "\n"
+                for dep in deps:
+                    yield json.dumps({"query": i, **dep}, ensure_ascii=False) + "\n"
+        return Response(stream(), mimetype="application/x-ndjson")
+
+    results, budget = [], MAX_DEPARTURES_JSON
+    for q in queries:
+        head, deps = query_departures(q if isinstance(q, dict) else {}, version, today)
+        if len(deps) > budget:
+            deps, head["truncated"] = deps[:budget], True
+        budget -= len(deps)
+        results.append({**head, "departures": deps})
+    return jsonify({"results": results})
+
+# ──────────────────────────────────────────
+#  API: ボード用コンパイル済み時刻表 (ブラウザ側カウントダウン用)
+# ──────────────────────────────────────────
+# GET /api/timetable?board=...&day=weekday
+#   ボードの全方面の 1 日分の発車 [["HH:MM", 種別, 行先], ...] と walk/run/max、
+#   現在の遅延 overlay を返す。static/app.js はこれを 1 回取得し、
+#   残り時間・「歩けば/走れば」を毎秒ローカルで計算する (/api/schedule と同じ規則)。
+#   version が変わったとき・曜日区分が変わったときだけ取り直せばよい。
+def compile_board_timetable(board: str, routes: list[dict], day_type: str, now: datetime) -> dict:
+    version = timetable_data_version()
+    out_routes = []
+    for r in routes:
+        dirs = []
         for d in r.get("directions", []):
-            if r["type"] == "train":
-                lst = fetch_train_schedule(r["line_code"], d["dest_tag"])
-            elif r["type"] == "bus_csv":
-                lst = fetch_bus_schedule_csv(r["type"], d["dest_tag"])
-            else:
-                sh  = sheet_name(r["type"], d.get("sheet_direction"))
-                lst = fetch_bus_schedule(sh, d["column"], r["file"])
-
-            # --- ここから修正: 今から早い順に並べてmax件だけ表示 ---
-            filtered = []
-            for item in lst:
-                if isinstance(item, dict):
-                    current_time_str = item["time"]
-                elif isinstance(item, str):
-                    current_time_str = item
-                else:
-                    continue
-                rm = remaining(current_time_str)
-                if not (0 < rm.total_seconds() < 86400):
-                    continue
-                mins = int(rm.total_seconds() // 60)
-                if mins < r["run"]:
-                    continue
-                filtered.append((rm, item, mins, current_time_str))
-            # 残り時間の昇順でソート
-            filtered.sort(key=lambda x: x[0])
-            show, cnt = [], 0
-            for tup in filtered:
-                if cnt >= r["max"]:
-                    break
-                _, item, mins, current_time_str = tup
-                adv = "歩けば間に合います" if mins >= r["walk"] else "走れば間に合います"
-                display_parts = [f"{current_time_str}発"]
-                if isinstance(item, dict):
-                    train_type = item.get("type", "").strip()
-                    destination = item.get("dest", "").strip()
-                    if train_type and train_type not in ["-", "ー"]:
-                        display_parts.append(f"【{train_type}】")
-                    if destination and destination not in ["-", "ー"]:
-                        display_parts.append(f"{destination}行")
-                display_parts.append(f"- {mins}分 {adv}")
-                show.append(f"{labs[cnt]}: {' '.join(display_parts)}")
-                cnt += 1
-            mp[d["column"]] = show
-        ent["schedules"] = mp
-        res["routes"].append(ent)
+            _, deps = timetable_index(r["id"], d["column"], day_type, version)
+            dirs.append({"column": d["column"],
+                         "deps": [[x["time"], x["type"], x["dest"]] for x in deps]})
+        out_routes.append({"id": r["id"], "label": r["label"], "walk": r["walk"], "run": r["run"],
+                           "max": r["max"], "overlay": line_overlay(r, now), "directions": dirs})
+    digest = hashlib.sha1(json.dumps(out_routes, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return {"board": board, "day": day_type, "version": digest.hexdigest()[:12],
+            "overlay_window": OVERLAY_WINDOW, "routes": out_routes}
+
+
+@app.route("/api/timetable")
+def api_timetable():
+    board  = request.args.get("board", DEFAULT_BOARD)
+    routes = BOARD_ROUTES.get(board)
+    if routes is None:
+        abort(404)
+    now = current_time()
+    day = request.args.get("day") or day_type_of(now)
+    if day not in DAY_TYPES:
+        return jsonify({"error": f"day must be one of {list(DAY_TYPES)}"}), 400
+    return jsonify(compile_board_timetable(board, routes, day, now))
 
-    return jsonify(res)
+
+# ──────────────────────────────────────────
+#  乗換検索 : Connection Scan (最早到着)
+# ──────────────────────────────────────────
+# 接続 = (発分, 着分, 乗車駅, 降車駅, 路線id, 方面, 発車dict)。
+# 各発車から ride に書かれた各駅への直通接続を 1 本ずつ作り、発時刻順に 1 回走査する。
+# 出発地はボード (その路線の stop へ walk 分で歩く)。
+TRANSFER_MIN    = 3         # 乗換時の最小余裕 (分)
+JOURNEY_HORIZON = 6 * 60    # 出発時刻から探索する時間幅 (分)
+_NEXT_DAY_TYPE  = {"weekday": "weekday", "saturday": "holiday", "holiday": "weekday"}
+
+
+@lru_cache(maxsize=8)
+def journey_connections(day_type: str, version: float) -> tuple[list[int], list[tuple]]:
+    """曜日区分ごとの全接続を発時刻順に並べた (発分リスト, 接続リスト)"""
+    conns = []
+    for r in ROUTES:
+        for d in r.get("directions", []):
+            ride = d.get("ride")
+            if not ride or not r.get("stop"):
+                continue
+            _, deps = timetable_index(r["id"], d["column"], day_type, version)
+            for dep in deps:
+                for station, mins in ride.items():
+                    conns.append((dep["minute"], dep["minute"] + mins, r["stop"], station,
+                                  r["id"], d["column"], dep))
+    conns.sort(key=lambda c: (c[0], c[1]))
+    return [c[0] for c in conns], conns
+
+
+def journey_stations() -> set[str]:
+    """乗換検索の目的地に指定できる駅・停留所"""
+    out = set()
+    for r in ROUTES:
+        if r.get("stop"):
+            out.add(r["stop"])
+        for d in r.get("directions", []):
+            out.update(d.get("ride", {}))
+    return out
+
+
+def _fmt_minute(m: int) -> str:
+    return f"{(m // 60) % 24:02d}:{m % 60:02d}"
+
+
+def plan_journey(routes: list[dict], dest: str, start: int, day_type: str,
+                 next_day_type: str, version: float) -> dict | None:
+    """
+    routes (ボードの路線) の stop から歩き出し、start (0:00 からの分) 以降で
+    dest に最も早く着く経路を返す。見つからなければ None。
+    翌日分の接続は 1440 分ずらして続けて走査する。
+    """
+    inf = float("inf")
+    walk: dict[str, int] = {}
+    for r in routes:
+        if r.get("stop"):
+            walk[r["stop"]] = min(walk.get(r["stop"], inf), r["walk"])
+    ready   = {stop: start + w for stop, w in walk.items()}   # 乗車できる最早時刻
+    arrival = dict(ready)                                     # 到着の最早時刻
+    parent: dict[str, tuple] = {}                             # 駅 ➜ (接続, 日オフセット)
+    best    = arrival.get(dest, inf)
+    limit   = start + JOURNEY_HORIZON
+
+    for offset, day in ((0, day_type), (1440, next_day_type)):
+        if offset and limit < offset:
+            break
+        deps, conns = journey_connections(day, version)
+        i = bisect.bisect_left(deps, start - offset)
+        for c in conns[i:] if i < len(conns) else ():
+            dep = c[0] + offset
+            if dep >= best or dep > limit:
+                break
+            if ready.get(c[2], inf) > dep:
+                continue
+            arr = c[1] + offset
+            if arr >= arrival.get(c[3], inf):
+                continue
+            arrival[c[3]] = arr
+            # 歩いて行ける駅に乗り換え時間込みで遅く着く場合は、乗車可能時刻も経路も変えない
+            if c[3] == dest:
+                best = arr
+                parent[c[3]] = (c, offset)
+            elif arr + TRANSFER_MIN < ready.get(c[3], inf):
+                ready[c[3]]  = arr + TRANSFER_MIN
+                parent[c[3]] = (c, offset)
+
+    if best == inf:
+        return None
+
+    legs, station = [], dest
+    while station in parent:
+        c, offset = parent[station]
+        dep = c[6]
+        legs.append({"mode": "ride", "route": c[4], "label": ROUTE_BY_ID[c[4]]["label"],
+                     "direction": c[5], "from": c[2], "to": c[3],
+                     "dep": _fmt_minute(c[0] + offset), "arr": _fmt_minute(c[1] + offset),
+                     "type": dep["type"], "dest": dep["dest"]})
+        station = c[2]
+    legs.append({"mode": "walk", "to": station, "minutes": walk[station]})
+    legs.reverse()
+    return {"depart": _fmt_minute(start), "arrive": _fmt_minute(int(best)),
+            "minutes": int(best) - start, "legs": legs}
+
+
+@app.route("/api/journey")
+def api_journey():
+    """GET /api/journey?to=渋谷[&board=...][&at=HH:MM][&day=weekday]"""
+    board  = request.args.get("board", DEFAULT_BOARD)
+    routes = BOARD_ROUTES.get(board)
+    if routes is None:
+        abort(404)
+    dest = request.args.get("to", "")
+    if dest not in journey_stations():
+        return jsonify({"error": "unknown destination", "stations": sorted(journey_stations())}), 400
+
+    now = current_time()
+    day = request.args.get("day")
+    if day is None:
+        day, next_day = day_type_of(now), day_type_of(now + timedelta(days=1))
+    elif day in DAY_TYPES:
+        next_day = _NEXT_DAY_TYPE[day]
+    else:
+        return jsonify({"error": f"day must be one of {list(DAY_TYPES)}"}), 400
+    try:
+        start = _parse_hhmm(request.args.get("at"), now.hour * 60 + now.minute)
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid at"}), 400
+
+    plan = plan_journey(routes, dest, start, day, next_day, timetable_data_version())
+    return jsonify({"board": board, "to": dest, "day": day, "journey": plan})
+
+# ──────────────────────────────────────────
+#  上流データのスナップショット (再起動時のウォームスタート)
+# ──────────────────────────────────────────
+# 天気 (整形済み)・ニュース・運行情報の最後に取れた結果をファイルへ定期保存し、起動時に読み込む。
+# 読み込んだ内容は stale 扱いで即座に返し、裏で取り直せた時点で stale が外れる。
+SNAPSHOT_FILE     = BASE_DIR / "warm_snapshot.json"
+SNAPSHOT_INTERVAL = timedelta(seconds=60)    # ファイルへ書き出す最短間隔
+
+_warm: dict[str, dict] = {}          # 種別 ➜ {"data": ..., "ts": 取得時刻, "stale": bool}
+_warm_lock = threading.Lock()
+_warm_refreshing: set[str] = set()   # 裏で取り直し中の種別
+_warm_last_write = datetime.min
+
+
+def save_warm_snapshot() -> None:
+    """_warm を一時ファイルに書いて os.replace で差し替える (途中で落ちても壊れない)"""
+    with _warm_lock:
+        payload = {k: {"data": v["data"], "ts": v["ts"]} for k, v in _warm.items()}
+    fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_FILE.parent, prefix=".warm_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, SNAPSHOT_FILE)
+    except Exception as e:
+        logging.error(f"snapshot write failed: {e}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def load_warm_snapshot() -> None:
+    """起動時にスナップショットを読み込む (全種別 stale 扱い)"""
+    if not SNAPSHOT_FILE.exists():
+        return
+    try:
+        payload = json.loads(SNAPSHOT_FILE.read_text(encoding="utf-8"))
+    except Exception as e:
+        logging.error(f"snapshot read failed: {e}")
+        return
+    with _warm_lock:
+        for kind, ent in payload.items():
+            if isinstance(ent, dict) and "data" in ent:
+                _warm[kind] = {"data": ent["data"], "ts": ent.get("ts"), "stale": True}
+    logging.info(f"snapshot loaded: {sorted(_warm)} ({SNAPSHOT_FILE.name})")
+
+
+def remember(kind: str, data) -> None:
+    """取得に成功した結果を保持し、SNAPSHOT_INTERVAL ごとにファイルへ書き出す"""
+    global _warm_last_write
+    now = current_time()
+    with _warm_lock:
+        _warm[kind] = {"data": data, "ts": now.isoformat(timespec="seconds"), "stale": False}
+        due = now - _warm_last_write >= SNAPSHOT_INTERVAL
+        if due:
+            _warm_last_write = now
+    if due:
+        save_warm_snapshot()
+
+
+def refresh_in_background(kind: str, fetch) -> None:
+    """fetch() を別スレッドで 1 本だけ走らせ、成功すれば remember する"""
+    with _warm_lock:
+        if kind in _warm_refreshing:
+            return
+        _warm_refreshing.add(kind)
+
+    def run():
+        try:
+            data = fetch()
+            if data:
+                remember(kind, data)
+        except Exception as e:
+            logging.error(f"{kind} refresh failed: {e}")
+        finally:
+            with _warm_lock:
+                _warm_refreshing.discard(kind)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def serve_warm(kind: str, fetch):
+    """
+    (データ, stale) を返す。
+    起動直後で stale なスナップショットしかなければそれを即座に返し、裏で取り直す。
+    それ以外はその場で取得し、失敗 (空) ならスナップショットで代用する。
+    """
+    ent = _warm.get(kind)
+    if ent and ent["stale"]:
+        refresh_in_background(kind, fetch)
+        return ent["data"], True
+    data = fetch()
+    if data:
+        remember(kind, data)
+        return data, False
+    if ent:
+        return ent["data"], True
+    return data, False
+
+
+load_warm_snapshot()
 
 # ──────────────────────────────────────────
 #  API: 天気情報
 # ──────────────────────────────────────────
 W_URL = "https://weather.tsukumijima.net/api/forecast/city/130010"
 
+# 気象庁の予報発表 (5時・11時・17時) に合わせて取り直す。それ以外の時間は
+# 整形済みの小さな JSON (バイト列) をそのまま返し、上流の全文は保持しない。
+WEATHER_PUBLISH_HOURS = (5, 11, 17)
+WEATHER_PUBLISH_LAG   = timedelta(minutes=10)   # 発表から API に反映されるまでの余裕
+WEATHER_RETRY         = timedelta(minutes=5)    # 取得失敗時の再試行間隔
+
+_weather_state: dict = {"payload": None, "body": None, "expires": datetime.min}
+_weather_lock = threading.Lock()
+
+
+def next_weather_refresh(now: datetime) -> datetime:
+    """now より後の次の取り直し時刻 (発表時刻 + WEATHER_PUBLISH_LAG)"""
+    for h in WEATHER_PUBLISH_HOURS:
+        t = now.replace(hour=h, minute=0, second=0, microsecond=0) + WEATHER_PUBLISH_LAG
+        if t > now:
+            return t
+    tomorrow = now + timedelta(days=1)
+    return tomorrow.replace(hour=WEATHER_PUBLISH_HOURS[0], minute=0, second=0,
+                            microsecond=0) + WEATHER_PUBLISH_LAG
+
+
+def trim_weather(raw: dict) -> dict:
+    """つくみじま API の応答から画面 (drawWeather) が使う項目だけを取り出す"""
+    forecasts = []
+    for f in raw.get("forecasts", [])[:3]:
+        forecasts.append({
+            "date_label": f.get("dateLabel", ""),
+            "telop":      f.get("telop", ""),
+            "icon":       (f.get("image") or {}).get("url", ""),
+            "rain":       (f.get("chanceOfRain") or {}).get("T12_18") or "",
+            "wind":       (f.get("detail") or {}).get("wind") or "",
+        })
+    if not forecasts:
+        return {}
+    return {"public_time": raw.get("publicTime", ""), "forecasts": forecasts}
+
 
 def get_weather() -> dict:
     try:
-        return requests.get(W_URL, timeout=6).json()
+        return trim_weather(requests.get(W_URL, timeout=6).json())
     except Exception as e:
         print("Weather error:", e)
         return {}
 
 
+def _set_weather(payload: dict, stale: bool, expires: datetime) -> None:
+    body = json.dumps({**payload, "stale": stale}, ensure_ascii=False).encode("utf-8")
+    with _weather_lock:
+        _weather_state.update(payload=payload, body=body, expires=expires)
+
+
+def refresh_weather() -> dict:
+    """取り直して整形済み本文を差し替える。失敗時は手元の内容を stale にして少し後に再試行"""
+    payload = get_weather()
+    now = current_time()
+    if payload:
+        _set_weather(payload, False, next_weather_refresh(now))
+    elif _weather_state["payload"]:
+        _set_weather(_weather_state["payload"], True, now + WEATHER_RETRY)
+    else:
+        with _weather_lock:
+            _weather_state["expires"] = now + WEATHER_RETRY
+    return payload
+
+
 @app.route("/api/weather")
 def api_weather():
-    return jsonify(get_weather())
+    if _weather_state["body"] is None:
+        data = (_warm.get("weather") or {}).get("data") or {}
+        # 画面用に絞る前のスナップショット (API の応答そのまま) なら、ここで絞り直す
+        forecasts = data.get("forecasts") or []
+        if not forecasts or any("date_label" not in f for f in forecasts):
+            data = trim_weather(data)
+        if data:   # 起動直後: スナップショットを stale で返し、裏で取り直す
+            _set_weather(data, True, datetime.min)
+        elif current_time() >= _weather_state["expires"]:
+            # その場で取るのは再試行時刻を過ぎたときだけ。上流が落ちている間は待たせずに {} を返す
+            payload = refresh_weather()
+            if payload:
+                remember("weather", payload)
+    if current_time() >= _weather_state["expires"]:
+        refresh_in_background("weather", refresh_weather)
+    return Response(_weather_state["body"] or b"{}", mimetype="application/json")
 
 # ──────────────────────────────────────────
 #  API: ニュース
@@ -508,7 +1363,8 @@ def get_news() -> list[str]:
 
 @app.route("/api/news")
 def api_news():
-    return jsonify({"news": get_news()})
+    data, stale = serve_warm("news", get_news)
+    return jsonify({"news": data, "stale": stale})
 
 # ──────────────────────────────────────────
 #  API: 運行情報 (Tokyu + ODPT)
@@ -543,108 +1399,140 @@ ENDPOINT_CHALLENGE     = "https://api-challenge.odpt.org/api/v4"
 # 都営地下鉄 GTFS リアルタイム（列車遅延アラート用）
 TOEI_ALERT_ENDPOINT    = f"{ENDPOINT_MAIN}/gtfs/realtime/toei_odpt_train_alert"
 
-# ── 各路線アイコンマップ ───────────────────────────────────────────
-ICON_MAP = {
-    # 東急電鉄
-    "Toyoko":            "tokyurailway/icon_TY.png",
-    "DenEnToshi":        "tokyurailway/icon_DT.png",
-    "Ikegami":           "tokyurailway/icon_IK.png",
-    "Meguro":            "tokyurailway/icon_MG.png",
-    "Oimachi":           "tokyurailway/icon_OM.png",
-    "Setagaya":          "tokyurailway/icon_SG.png",
-    "TokyuTamagawa":     "tokyurailway/icon_TM.png",
-    "Kodomonokuni":      "tokyurailway/icon_KD.png",
-    "TokyuShinYokohama": "tokyurailway/icon_SH.png",
-    # 東京メトロ
-    "Chiyoda":           "tokyometro/icon_chiyoda.png",
-    "Fukutoshin":        "tokyometro/icon_fukutoshin.png",
-    "Ginza":             "tokyometro/icon_ginza.png",
-    "Hanzomon":          "tokyometro/icon_hanzomon.png",
-    "Hibiya":            "tokyometro/icon_hibiya.png",
-    "Marunouchi":        "tokyometro/icon_marunouchi.png",
-    "Namboku":           "tokyometro/icon_namboku.png",
-    "Tozai":             "tokyometro/icon_tozai.png",
-    "Yurakucho":         "tokyometro/icon_yurakucho.png",
-    # 都営地下鉄
-    "Oedo":              "toei/icon_oedo.png",
-    "Asakusa":           "toei/icon_asakusa.png",
-    "Mita":              "toei/icon_mita.png",
-    "Shinjuku":          "toei/icon_shinjuku.png",
-    "Arakawa":           "toei/icon_arakawa.png",
-    # 横浜市営地下鉄
-    "Blue":              "yokohama/icon_blue.png",
-    "Green":             "yokohama/icon_green.png",
-    # 東武鉄道
-    "Tojo":              "tobu/icon_tojo.png",
-    "Isesaki":           "tobu/icon_isesaki.png",
-    "TobuSkytree":       "tobu/icon_skytree.png",
-    "Nikko":             "tobu/icon_nikko.png",
-    "TobuUrbanPark":     "tobu/icon_urbanpark.png",
-    # JR東日本
-    "Yamanote":          "JR/icon_JY.png",
-    "KeihinTohokuNegishi": "JR/icon_JK.png",
-    "Tokaido":           "JR/icon_JT.png",
-    "ChuoRapid":         "JR/icon_JC.png",
-    "ChuoSobuLocal":     "JR/icon_JB.png",
-    "Yokosuka":          "JR/icon_JO.png",
-    "SobuRapid":         "JR/icon_JO.png",
-    "ShonanShinjuku":    "JR/icon_JS.png",
-    "Utsunomiya":        "JR/icon_JU.png",
-    "Takasaki":          "JR/icon_JU.png",
-    "Keiyo":             "JR/icon_JE.png",
-    "Musashino":         "JR/icon_JM.png",
-    "Yokohama":          "JR/icon_JH.png",
-    "JobanRapid":        "JR/icon_JJ.png",
-    "JobanLocal":        "JR/icon_JL.png",
-    # 多摩モノレール
-    "TamaMonorail":      "icon_tamamonorail.png",
+# ── 路線メタデータ (事業者ごと) ─────────────────────────────────────
+# 路線IDの接頭辞 ➜ {路線コード: (日本語名, アイコン)}。アイコンは static/img/ からの相対パス (無ければ None)。
+# 東武と JR の「宇都宮線」のように同じ路線コードが事業者をまたいで現れるため、
+# 路線コードだけでなく事業者ごとに分けて持つ。キーは ODPT の路線ID そのままの接頭辞
+# (東武は事業者 odpt.Operator:TobuRailway だが路線ID は odpt.Railway:Tobu.*)。
+RAIL_LINES: dict[str, dict[str, tuple[str, str | None]]] = {
+    "odpt.Railway:Tokyu": {
+        "Toyoko":            ("東横線",       "tokyurailway/icon_TY.png"),
+        "Meguro":            ("目黒線",       "tokyurailway/icon_MG.png"),
+        "TokyuShinYokohama": ("東急新横浜線", "tokyurailway/icon_SH.png"),
+        "DenEnToshi":        ("田園都市線",   "tokyurailway/icon_DT.png"),
+        "Oimachi":           ("大井町線",     "tokyurailway/icon_OM.png"),
+        "Ikegami":           ("池上線",       "tokyurailway/icon_IK.png"),
+        "TokyuTamagawa":     ("東急多摩川線", "tokyurailway/icon_TM.png"),
+        "Setagaya":          ("世田谷線",     None),   # icon_SG.png は未同梱
+        "Kodomonokuni":      ("こどもの国線", "tokyurailway/icon_KD.png"),
+    },
+    "odpt.Railway:JR-East": {
+        "Yamanote":            ("山手線",               "JR/icon_JY.png"),
+        "KeihinTohokuNegishi": ("京浜東北・根岸線",     "JR/icon_JK.png"),
+        "Tokaido":             ("東海道線",             "JR/icon_JT.png"),
+        "ChuoRapid":           ("中央線快速",           "JR/icon_JC.png"),
+        "ChuoSobuLocal":       ("中央・総武線各駅停車", "JR/icon_JB.png"),
+        "Yokosuka":            ("横須賀線",             "JR/icon_JO.png"),
+        "SobuRapid":           ("総武快速線",           "JR/icon_JO.png"),
+        "ShonanShinjuku":      ("湘南新宿ライン",       "JR/icon_JS.png"),
+        "Utsunomiya":          ("宇都宮線",             "JR/icon_JU.png"),
+        "Takasaki":            ("高崎線",               "JR/icon_JU.png"),
+        "Keiyo":               ("京葉線",               "JR/icon_JE.png"),
+        "Musashino":           ("武蔵野線",             "JR/icon_JM.png"),
+        "Yokohama":            ("横浜線",               "JR/icon_JH.png"),
+        "JobanRapid":          ("常磐線快速",           "JR/icon_JJ.png"),
+        "JobanLocal":          ("常磐線各駅停車",       "JR/icon_JL.png"),
+    },
+    "odpt.Railway:TokyoMetro": {
+        "Ginza":            ("銀座線",             "tokyometro/icon_ginza.png"),
+        "Marunouchi":       ("丸の内線",           "tokyometro/icon_marunouchi.png"),
+        "MarunouchiBranch": ("丸の内線方南町支線", None),
+        "Hibiya":           ("日比谷線",           "tokyometro/icon_hibiya.png"),
+        "Tozai":            ("東西線",             "tokyometro/icon_tozai.png"),
+        "Chiyoda":          ("千代田線",           "tokyometro/icon_chiyoda.png"),
+        "Yurakucho":        ("有楽町線",           "tokyometro/icon_yurakucho.png"),
+        "Hanzomon":         ("半蔵門線",           "tokyometro/icon_hanzomon.png"),
+        "Namboku":          ("南北線",             "tokyometro/icon_namboku.png"),
+        "Fukutoshin":       ("副都心線",           "tokyometro/icon_fukutoshin.png"),
+    },
+    "odpt.Railway:Toei": {
+        "Asakusa":       ("浅草線",                         "toei/icon_asakusa.png"),
+        "Mita":          ("三田線",                         "toei/icon_mita.png"),
+        "Shinjuku":      ("新宿線",                         "toei/icon_shinjuku.png"),
+        "Oedo":          ("大江戸線",                       "toei/icon_oedo.png"),
+        "Arakawa":       ("都電荒川線（東京さくらトラム）", "toei/icon_arakawa.png"),
+        "NipporiToneri": ("日暮里舎人ライナー",             None),
+    },
+    "odpt.Railway:YokohamaMunicipal": {
+        "Blue":  ("横浜市営地下鉄・ブルーライン", "yokohama/icon_blue.png"),
+        "Green": ("横浜市営地下鉄・グリーンライン", "yokohama/icon_green.png"),
+    },
+    "odpt.Railway:Tobu": {
+        "Tojo":              ("東上線",                       "tobu/icon_tojo.png"),
+        "Ogose":             ("越生線",                       None),
+        "Isesaki":           ("伊勢崎線",                     "tobu/icon_isesaki.png"),
+        "TobuSkytree":       ("スカイツリーライン",           "tobu/icon_skytree.png"),
+        "TobuSkytreeBranch": ("スカイツリーライン(押上-曳舟)", None),
+        "Kameido":           ("亀戸線",                       None),
+        "Daishi":            ("大師線",                       None),
+        "Sano":              ("佐野線",                       None),
+        "Kiryu":             ("桐生線",                       None),
+        "Koizumi":           ("小泉線",                       None),
+        "KoizumiBranch":     ("小泉線(支線)",                 None),
+        "Nikko":             ("日光線",                       "tobu/icon_nikko.png"),
+        "Utsunomiya":        ("宇都宮線",                     None),   # JR の宇都宮線とは別
+        "Kinugawa":          ("鬼怒川線",                     None),
+        "TobuUrbanPark":     ("アーバンパークライン",         "tobu/icon_urbanpark.png"),
+    },
+    "odpt.Railway:TamaMonorail": {
+        "TamaMonorail": ("多摩モノレール", "icon_tamamonorail.png"),
+    },
+    "odpt.Railway:TWR": {
+        "Rinkai": ("りんかい線", None),
+    },
+    "odpt.Railway:MIR": {
+        "TsukubaExpress": ("つくばエクスプレス線", None),
+    },
 }
 
-RAIL_NAME_MAP = {
-    "Fukutoshin": "副都心線", "Namboku": "南北線", "Hanzomon": "半蔵門線",
-    "Yurakucho": "有楽町線", "Chiyoda": "千代田線", "Tozai": "東西線",
-    "Hibiya": "日比谷線", "Marunouchi": "丸の内線", "MarunouchiBranch": "丸の内線方南町支線",
-    "Ginza": "銀座線", "Asakusa": "浅草線", "Mita": "三田線", "Shinjuku": "新宿線",
-    "Oedo": "大江戸線", "Arakawa": "都電荒川線（東京さくらトラム）", "NipporiToneri": "日暮里舎人ライナー",
-    "TamaMonorail": "多摩モノレール", "Rinkai": "りんかい線", "TsukubaExpress": "つくばエクスプレス線",
-    "Green": "横浜市営地下鉄・グリーンライン", "Blue": "横浜市営地下鉄・ブルーライン",
-    # — 東急電鉄 —
-    "Toyoko":        "東横線", "Meguro":        "目黒線", "TokyuShinYokohama":"東急新横浜線",
-    "DenEnToshi":    "田園都市線", "Oimachi":       "大井町線", "Ikegami":       "池上線",
-    "TokyuTamagawa": "東急多摩川線", "Setagaya":      "世田谷線", "Kodomonokuni":  "こどもの国線",
-    # — 東武鉄道 —
-    "Tojo":              "東上線",
-    "Ogose":             "越生線",
-    "Isesaki":           "伊勢崎線",
-    "TobuSkytree":       "スカイツリーライン",
-    "TobuSkytreeBranch": "スカイツリーライン(押上-曳舟)",
-    "Kameido":           "亀戸線",
-    "Daishi":            "大師線",
-    "Sano":              "佐野線",
-    "Kiryu":             "桐生線",
-    "Koizumi":           "小泉線",
-    "KoizumiBranch":     "小泉線(支線)",
-    "Nikko":             "日光線",
-    "Utsunomiya":        "宇都宮線", # JRの同名路線と区別される (Operatorが違うため)
-    "Kinugawa":          "鬼怒川線",
-    "TobuUrbanPark":     "アーバンパークライン",
-    # — JR東日本 —
-    "Yamanote":          "山手線",
-    "KeihinTohokuNegishi": "京浜東北・根岸線",
-    "Tokaido":           "東海道線",
-    "ChuoRapid":         "中央線快速",
-    "ChuoSobuLocal":     "中央・総武線各駅停車",
-    "Yokosuka":          "横須賀線",
-    "SobuRapid":         "総武快速線",
-    "ShonanShinjuku":    "湘南新宿ライン",
-    "Utsunomiya":        "宇都宮線",
-    "Takasaki":          "高崎線",
-    "Keiyo":             "京葉線",
-    "Musashino":         "武蔵野線",
-    "Yokohama":          "横浜線",
-    "JobanRapid":        "常磐線快速",
-    "JobanLocal":        "常磐線各駅停車",
-}
+
+# 路線IDの接頭辞と事業者コードの名前が食い違うもの (他は odpt.Railway:X ➜ odpt.Operator:X)
+_PREFIX_OPERATOR = {"odpt.Railway:Tobu": OPS["東武鉄道"]}
+
+
+def railway_operator(prefix: str) -> str:
+    """"odpt.Railway:Tokyu" ➜ "odpt.Operator:Tokyu" (OPS と同じ事業者コード)"""
+    return _PREFIX_OPERATOR.get(prefix, f"odpt.Operator:{prefix.split(':', 1)[-1]}")
+
+
+# 路線ID ➜ {id, operator, rc, line, logo}。起動時に 1 度だけ作り、運行情報の処理は辞書引き 1 回で済ませる
+RAILWAYS: dict[str, dict] = {}
+_RAILWAY_BY_OP_RC:   dict[tuple[str, str], dict] = {}   # (事業者, 路線コード) ➜ 同上
+_RAILWAY_BY_OP_NAME: dict[tuple[str, str], dict] = {}   # (事業者, 日本語名)   ➜ 同上 (HTML フォールバック用)
+for _prefix, _lines in RAIL_LINES.items():
+    _op = railway_operator(_prefix)
+    for _rc, (_name, _icon) in _lines.items():
+        _meta = {"id": f"{_prefix}.{_rc}", "operator": _op, "rc": _rc, "line": _name, "logo": _icon}
+        RAILWAYS[_meta["id"]] = _meta
+        _RAILWAY_BY_OP_RC[(_op, _rc)] = _meta
+        _RAILWAY_BY_OP_NAME.setdefault((_op, _name), _meta)
+
+
+def railway_meta(raw: str, operator_code: str | None = None) -> dict | None:
+    """
+    ODPT の路線ID ➜ RAILWAYS の項目。
+    RAIL_LINES に無い接頭辞の ID で届いた場合は (事業者, 路線コード) で引き直す。
+    """
+    meta = RAILWAYS.get(raw)
+    if meta is None and operator_code:
+        meta = _RAILWAY_BY_OP_RC.get((operator_code, raw.rsplit(".", 1)[-1]))
+    return meta
+
+
+def traininfo_entry(item: dict, operator_code: str) -> dict[str, str] | None:
+    """odpt:TrainInformation の 1 件 ➜ {'line', 'status', 'logo', 'rc', 'railway'} (路線IDが無ければ None)"""
+    raw = item.get("odpt:railway", "")
+    if not raw:
+        return None
+    meta = railway_meta(raw, operator_code)
+    rc   = meta["rc"] if meta else raw.rsplit(".", 1)[-1]
+    return {
+        "line":    meta["line"] if meta else rc,
+        "status":  item.get("odpt:trainInformationText", {}).get("ja", "情報なし"),
+        "logo":    meta["logo"] if meta else None,   # static/img/ からの相対パス
+        "rc":      rc,
+        "railway": meta["id"] if meta else raw,      # 登録済みなら RAILWAYS のキーに揃える
+    }
 
 # ── 東急電鉄運行情報取得 ─────────────────────────
 def fetch_tokyu_traininfo() -> list[dict[str, str]]:
@@ -669,23 +1557,63 @@ def fetch_tokyu_traininfo() -> list[dict[str, str]]:
         logging.error(f"API request failed: {e}. Falling back to HTML scraping.")
         return fetch_tokyu_htmlinfo()
 
-    out: list[dict[str, str]] = []
-    for item in data:
-        raw = item.get("odpt:railway", "")
-        if not raw: continue
-        rc  = raw.split('.')[-1]
-        line_ja = RAIL_NAME_MAP.get(rc, rc)
-        txt = item.get("odpt:trainInformationText", {}).get("ja", "情報なし")
-        icon_path = ICON_MAP.get(rc)  # url_for を使わず、パスを直接取得
-        out.append({
-            "line":   line_ja,
-            "status": txt,
-            "logo":   icon_path,  # ここではパスを返す
-            "rc":     rc
-        })
-    return out
+    entries = (traininfo_entry(item, "odpt.Operator:Tokyu") for item in data)
+    return [ent for ent in entries if ent]
 
 # --- HTMLスクレイピングによる東急運行情報取得 ---
+# 運行情報ブロック (.unten_info-body-item) だけを木にする。ページ先頭の <head> 等は
+# 最初のブロックより前を切り捨てて字句解析もしない。正規表現で見つからない書き方
+# (引用符なしの class= など) でも取りこぼさないよう、その場合は全文を同じ条件で解析する。
+_TOKYU_ITEM_CLASS    = "unten_info-body-item"
+_TOKYU_ITEM_STRAINER = SoupStrainer(class_=_TOKYU_ITEM_CLASS)
+_TOKYU_ITEM_TAG_RE   = re.compile(r"<[a-zA-Z][^>]*class=[\"'][^\"']*\bunten_info-body-item\b")
+
+# アイコンファイルの末尾コード ("icon_TY.png" ➜ "ty") ➜ RAILWAYS のアイコン
+LINE_ICONS = list(dict.fromkeys(m["logo"] for m in RAILWAYS.values() if m["logo"]))
+_ICON_BY_CODE: dict[str, str] = {}
+for _path in LINE_ICONS:
+    _ICON_BY_CODE.setdefault(Path(_path).stem.split("_")[-1].lower(), _path)
+
+
+@lru_cache(maxsize=256)
+def icon_for_code(code: str) -> str | None:
+    """公式サイトの画像コード ➜ ローカルアイコン (未知のコードは部分一致で探して記憶)"""
+    code = code.lower()
+    if code in _ICON_BY_CODE:
+        return _ICON_BY_CODE[code]
+    for val in LINE_ICONS:
+        if code in val.lower():
+            return val
+    return None
+
+
+def parse_tokyu_html(text: str) -> list[dict[str, str]]:
+    """unten.html の本文から [{'line', 'status', 'logo' (+ 既知の路線なら 'rc', 'railway')}] を取り出す"""
+    m = _TOKYU_ITEM_TAG_RE.search(text)
+    soup = BeautifulSoup(text[m.start():] if m else text, 'html.parser', parse_only=_TOKYU_ITEM_STRAINER)
+    result = []
+    for item in soup.find_all(class_=_TOKYU_ITEM_CLASS):
+        line   = item.select_one('.line-name')
+        status = item.select_one('.unten_info-status-text')
+        img    = item.select_one('img')
+        if not line or not status: continue
+        line_text = line.get_text(strip=True)
+        status_text = status.get_text(strip=True)
+        logo_path = None  # logo_url から logo_path に変更
+        if img and img.has_attr('src'):
+            img_filename = Path(img['src']).name
+            icon_key = img_filename.replace('.png', '').split('_')[-1]
+            logo_path = icon_for_code(icon_key)  # パスをそのまま格納
+        entry = {'line': line_text, 'status': status_text, 'logo': logo_path}
+        meta = _RAILWAY_BY_OP_NAME.get(("odpt.Operator:Tokyu", line_text))
+        if meta:   # API と同じく路線IDを付ける (表示対象の判定・遅延反映に使う)
+            entry.update(rc=meta["rc"], railway=meta["id"], logo=logo_path or meta["logo"])
+        result.append(entry)
+    if not result:
+        logging.warning("HTML scraping: 運行情報ブロックが見つかりません")
+    return result
+
+
 def fetch_tokyu_htmlinfo() -> list[dict[str, str]]:
     """
     東急公式サイトをスクレイピングして運行情報を取得します。
@@ -698,27 +1626,7 @@ def fetch_tokyu_htmlinfo() -> list[dict[str, str]]:
         logging.error(f"HTML fetch failed: {e}")
         return []
 
-    soup = BeautifulSoup(res.text, 'html.parser')
-    result = []
-    for item in soup.select('.unten_info-body-item'):
-        line   = item.select_one('.line-name')
-        status = item.select_one('.unten_info-status-text')
-        img    = item.select_one('img')
-        if not line or not status: continue
-        line_text = line.get_text(strip=True)
-        status_text = status.get_text(strip=True)
-        logo_path = None  # logo_url から logo_path に変更
-        if img and img.has_attr('src'):
-            img_filename = Path(img['src']).name
-            icon_key = img_filename.replace('.png', '').split('_')[-1]
-            found_icon = None
-            for key, val in ICON_MAP.items():
-                if icon_key.lower() in val.lower():
-                    found_icon = val
-                    break
-            if found_icon:
-                logo_path = found_icon # パスをそのまま格納
-        result.append({'line': line_text, 'status': status_text, 'logo': logo_path})
+    result = parse_tokyu_html(res.text)
     logging.info(f"HTML scraping found {len(result)} records.")
     return result
 
@@ -726,7 +1634,7 @@ def fetch_tokyu_htmlinfo() -> list[dict[str, str]]:
 def fetch_odpt_traininfo(operator_code: str, endpoint: str, api_key: str) -> list[dict[str, str]]:
     """
     任意の事業者の運行情報を ODPT API から取得し、
-    [{ 'line': 路線名, 'status': 運行状況, 'logo': ロゴURL, 'rc': 路線コード }] のリストで返す。
+    [{ 'line': 路線名, 'status': 運行状況, 'logo': ロゴURL, 'rc': 路線コード, 'railway': 路線ID }] のリストで返す。
     """
     url = (
         f"{endpoint}/odpt:TrainInformation"
@@ -742,22 +1650,8 @@ def fetch_odpt_traininfo(operator_code: str, endpoint: str, api_key: str) -> lis
         logging.error(f"ODPT API request failed for {operator_code}: {e}")
         return []
 
-    out: list[dict[str, str]] = []
-    for item in data:
-        raw = item.get("odpt:railway", "")
-        if not raw:
-            continue
-        rc = raw.split(".")[-1]
-        line_ja = RAIL_NAME_MAP.get(rc, rc)
-        txt = item.get("odpt:trainInformationText", {}).get("ja", "情報なし")
-        icon_path = ICON_MAP.get(rc) # url_for を使わず、パスを直接取得
-        out.append({
-            "line": line_ja,
-            "status": txt,
-            "logo": icon_path, # ここではパスを返す
-            "rc": rc
-        })
-    return out
+    entries = (traininfo_entry(item, operator_code) for item in data)
+    return [ent for ent in entries if ent]
 
 # ──────────────────────────────────────────
 #  API: 運行情報 (設定)
@@ -779,17 +1673,11 @@ TRAIN_INFO_DISPLAY_ORDER = [
 # ──────────────────────────────────────────
 #  API: 運行情報 (Tokyu + ODPT)
 # ──────────────────────────────────────────
-@app.route("/api/status")
-def api_status():
+def collect_status() -> list[dict]:
     """
-    複数事業者の運行情報を路線ごとに返却します。
+    全事業者の運行情報を集めて [{"logo": ..., "text": ...}] を返す。
     異常情報を優先してリストの先頭に配置します。
     """
-    try:
-        max_lines = int(request.args.get('max_lines', 2))
-    except (ValueError, TypeError):
-        max_lines = 2
-
     abnormal_list = []
     normal_list = []
 
@@ -807,12 +1695,14 @@ def api_status():
                     all_infos = fetch_tokyu_traininfo()
                 else:
                     all_infos = fetch_odpt_traininfo(op_code, ENDPOINT_CHALLENGE, API_KEY_CHALLENGE)
-                # ★★★ 修正点: フィルタリング基準をアイコン有無から路線名定義の有無へ変更 ★★★
-                # これにより、アイコンがなくても名前が定義されていれば表示対象になる
-                all_infos = [info for info in all_infos if info.get("rc") in RAIL_NAME_MAP]
+                # RAILWAYS に登録された路線だけを表示する (アイコンが無くても名前があれば対象)
+                all_infos = [info for info in all_infos if info.get("railway") in RAILWAYS]
             else:
                 all_infos = fetch_odpt_traininfo(op_code, ENDPOINT_MAIN, API_KEY_MAIN)
-            
+
+            # 発車案内への遅延反映 (変化のあった路線だけ再計算される)
+            update_line_status(all_infos)
+
             # 2. 取得した情報を「異常」と「平常」に仕分ける
             for ent in all_infos:
                 text = f"{label} {ent.get('line', '')}: {ent.get('status', '情報なし')}"
@@ -828,21 +1718,42 @@ def api_status():
             # エラーが発生した場合はリストに追加しないか、エラーメッセージを追加するか選択
             # ここではシンプルにするため、何もしない
 
-    # 3. 異常リストと平常リストを結合し、指定された行数だけを返す
-    final_status_list = abnormal_list + normal_list
-    return jsonify({"status": final_status_list[:max_lines]})
+    # 3. 異常リストと平常リストを結合する
+    return abnormal_list + normal_list
+
+
+@app.route("/api/status")
+def api_status():
+    """
+    複数事業者の運行情報を路線ごとに返却します。
+    異常情報を優先してリストの先頭に配置します。
+    """
+    try:
+        max_lines = int(request.args.get('max_lines', 2))
+    except (ValueError, TypeError):
+        max_lines = 2
+
+    final_status_list, stale = serve_warm("status", collect_status)
+    return jsonify({"status": final_status_list[:max_lines], "stale": stale})
 
 # ──────────────────────────────────────────
 #  ルート
 # ──────────────────────────────────────────
 @app.route("/")
 def index():
-    return render_template("index.html", page=1)
+    return render_template("index.html", page=1, board=DEFAULT_BOARD)
 
 
 @app.route("/page/<int:p>")
 def index_page(p: int):
-    return render_template("index.html", page=p)
+    return render_template("index.html", page=p, board=DEFAULT_BOARD)
+
+
+@app.route("/board/<name>")
+def board_page(name: str):
+    if name not in BOARD_ROUTES:
+        abort(404)
+    return render_template("index.html", page=1, board=name)
 
 # ──────────────────────────────────────────
 #  API CHECK & UTILITIES (MOVED HERE)
@@ -867,9 +1778,9 @@ def get_line_logos(operator_code: str) -> list[dict[str, str]]:
         return []
     out = []
     for it in data:
-        raw = it.get("odpt:railway", "")
-        rc1 = raw.split(":")[-1]
-        rc  = rc1.split(".")[-1]
+        raw  = it.get("odpt:railway", "")
+        meta = railway_meta(raw, operator_code)
+        rc   = meta["rc"] if meta else raw.rsplit(".", 1)[-1]
         logo = it.get("odpt:systemMap")
         out.append({"railway": rc, "logo": logo})
     return out